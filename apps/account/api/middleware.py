@@ -0,0 +1,101 @@
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from django.conf import settings
+
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.exceptions import TokenError
+
+from apps.account.models import Profile
+
+
+JWT_SUBPROTOCOL = 'jwt'
+
+
+class ProfileCache:
+    """Small LRU of resolved profiles; each entry lives until its token expires."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        profile, expires_at = entry
+        if expires_at <= time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return profile
+
+    def set(self, key, profile, expires_at):
+        self.entries[key] = (profile, expires_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+profile_cache = ProfileCache(settings.WS_AUTH_CACHE_SIZE)
+
+
+def get_raw_token(scope):
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if query.get('token'):
+        return query['token'][0], None
+    # Browsers cannot set headers on a WebSocket, so the token may ride in
+    # Sec-WebSocket-Protocol as ["jwt", "<token>"].
+    subprotocols = scope.get('subprotocols') or []
+    if JWT_SUBPROTOCOL in subprotocols:
+        index = subprotocols.index(JWT_SUBPROTOCOL)
+        if index + 1 < len(subprotocols):
+            return subprotocols[index + 1], JWT_SUBPROTOCOL
+    return None, None
+
+
+@database_sync_to_async
+def get_profile(user_id):
+    return Profile.objects.filter(**{api_settings.USER_ID_FIELD: user_id}, is_active=True).first()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Populates scope["user"] from a SimpleJWT access token, if one was sent."""
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        raw_token, subprotocol = get_raw_token(scope)
+        if raw_token:
+            profile = await self.authenticate(raw_token)
+            if profile is not None:
+                scope['user'] = profile
+                scope['auth_subprotocol'] = subprotocol
+        return await super().__call__(scope, receive, send)
+
+    async def authenticate(self, raw_token):
+        try:
+            token = AccessToken(raw_token)
+        except TokenError:
+            return None
+        user_id = token.get(api_settings.USER_ID_CLAIM)
+        profile = profile_cache.get(user_id)
+        if profile is None:
+            profile = await get_profile(user_id)
+            if profile is None:
+                return None
+            expires_at = min(token['exp'], time.time() + settings.WS_AUTH_CACHE_MAX_TTL)
+            profile_cache.set(user_id, profile, expires_at)
+        return profile
+
+
+def JWTAuthMiddlewareStack(inner):
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
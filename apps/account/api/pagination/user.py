@@ -0,0 +1,8 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ProfileCursorPagination(CursorPagination):
+    ordering = 'username'
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
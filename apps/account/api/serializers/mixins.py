@@ -0,0 +1,28 @@
+FIELDS_QUERY_PARAM = 'fields'
+
+
+def requested_fields(request):
+    # ``?fields=id,name`` -> {'id', 'name'}; None when the client did not ask for a subset.
+    if request is None:
+        return None
+    value = request.query_params.get(FIELDS_QUERY_PARAM)
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Trims the serializer to the fields named in ``?fields=``. Fields listed
+    in ``Meta.optional_fields`` are only included when asked for by name.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = requested_fields(self.context.get('request'))
+        if requested is None:
+            dropped = set(getattr(self.Meta, 'optional_fields', ()))
+        else:
+            dropped = set(self.fields) - requested
+        for name in dropped:
+            self.fields.pop(name, None)
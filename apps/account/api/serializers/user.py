@@ -5,6 +5,9 @@ from rest_framework.exceptions import ValidationError
 
 from django.contrib.auth.hashers import make_password
 
+from apps.account.services.blacklist import is_blocked_by
+from apps.account.api.serializers.mixins import SparseFieldsMixin
+
 
 class RegisterUserSerializer(serializers.ModelSerializer):
     confirm_password = serializers.CharField(min_length=4, max_length=100, write_only=True)
@@ -31,12 +34,12 @@ class ProfileSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         target_user = self.instance
 
-        if user in target_user.blacklist.all():
+        if is_blocked_by(user.pk, target_user.pk):
             raise ValidationError("شما توسط این کاربر بلاک شده اید امکان مشاهده پروفایل را ندارید.")
 
         return attrs
 
-class UserListSerializer(serializers.ModelSerializer):
+class UserListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Profile
         fields = ['id', 'username', 'first_name', 'last_name']
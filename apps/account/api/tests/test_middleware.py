@@ -0,0 +1,67 @@
+import time
+
+from channels.testing import WebsocketCommunicator
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from django.test import SimpleTestCase, TransactionTestCase
+
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.account.models import Profile
+from apps.account.api.middleware import JWTAuthMiddleware, ProfileCache, profile_cache
+
+
+class WhoAmIConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        await self.accept(subprotocol=self.scope.get('auth_subprotocol'))
+        user = self.scope.get('user')
+        await self.send(text_data=user.username if user is not None else '')
+
+
+class JWTAuthMiddlewareTest(TransactionTestCase):
+    def setUp(self):
+        profile_cache.clear()
+        self.user = Profile.objects.create_user(username='user', password='password')
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.application = JWTAuthMiddleware(WhoAmIConsumer.as_asgi())
+
+    async def whoami(self, path, subprotocols=None):
+        communicator = WebsocketCommunicator(self.application, path, subprotocols=subprotocols)
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        username = await communicator.receive_from()
+        await communicator.disconnect()
+        return username, subprotocol
+
+    async def test_token_in_query_string(self):
+        username, _ = await self.whoami(f"/ws/?token={self.token}")
+        self.assertEqual(username, self.user.username)
+
+    async def test_token_in_subprotocol(self):
+        username, subprotocol = await self.whoami("/ws/", subprotocols=["jwt", self.token])
+        self.assertEqual(username, self.user.username)
+        self.assertEqual(subprotocol, "jwt")
+
+    async def test_invalid_token(self):
+        username, _ = await self.whoami("/ws/?token=invalid_token")
+        self.assertEqual(username, '')
+
+    async def test_profile_is_cached(self):
+        await self.whoami(f"/ws/?token={self.token}")
+        await Profile.objects.filter(id=self.user.id).aupdate(username='renamed')
+        username, _ = await self.whoami(f"/ws/?token={self.token}")
+        self.assertEqual(username, self.user.username)
+
+
+class ProfileCacheTest(SimpleTestCase):
+    def test_lru_eviction_and_expiry(self):
+        cache = ProfileCache(maxsize=2)
+        cache.set('a', 1, time.time() + 60)
+        cache.set('b', 2, time.time() + 60)
+        cache.get('a')
+        cache.set('c', 3, time.time() + 60)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+        cache.set('d', 4, time.time() - 1)
+        self.assertIsNone(cache.get('d'))
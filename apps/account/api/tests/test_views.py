@@ -104,9 +104,47 @@ class ProfileListViewTest (APITestCase):
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertIsInstance(response.data, list)
-        self.assertGreater(len(response.data), 0)
-        self.assertIn("username", response.data[0])
+        self.assertIsInstance(response.data['results'], list)
+        self.assertGreater(len(response.data['results']), 0)
+        self.assertIn("username", response.data['results'][0])
+
+    def test_profile_list_pages(self):
+        for i in range(3):
+            Profile.objects.create_user(username=f'user{i + 2}', password='password')
+        url = reverse('profile')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        response = self.client.get(url, {'page_size': 2, 'fields': 'username'})
+        self.assertEqual(response.data['results'], [{'username': 'user1'}, {'username': 'user2'}])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'], [{'username': 'user3'}, {'username': 'user4'}])
+        self.assertIsNone(response.data['next'])
+
+    def test_type_ahead(self):
+        Profile.objects.create_user(username='alireza', first_name='Ali', last_name='Karimi', password='password')
+        Profile.objects.create_user(username='zahra', first_name='علي', last_name='رضایی', password='password')
+        Profile.objects.create_user(username='mali', first_name='Maryam', password='password')
+        url = reverse('profile')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+        response = self.client.get(url, {'q': 'al'})
+        self.assertEqual([p['username'] for p in response.data], ['alireza'])
+
+        response = self.client.get(url, {'q': 'کار ali'})
+        self.assertEqual(response.data, [])
+        response = self.client.get(url, {'q': 'KAR ali'})
+        self.assertEqual([p['username'] for p in response.data], ['alireza'])
+
+        # Arabic ye in the stored name still matches Persian input.
+        response = self.client.get(url, {'q': 'علی رضا'})
+        self.assertEqual([p['username'] for p in response.data], ['zahra'])
+
+    def test_type_ahead_follows_renames(self):
+        self.user.first_name = 'Nima'
+        self.user.save()
+        url = reverse('profile')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        response = self.client.get(url, {'q': 'nim', 'limit': 1})
+        self.assertEqual([p['username'] for p in response.data], ['user1'])
 
 class LogoutUserViewTest(APITestCase):
     def setUp(self):
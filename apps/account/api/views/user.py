@@ -13,7 +13,10 @@ from rest_framework.generics import UpdateAPIView, CreateAPIView, ListAPIView
 
 
 from apps.account.models import Profile
+from apps.account.services.search import search_profiles
+from apps.account.services.blacklist import invalidate_blacklist
 from apps.account.api.filters.user import ProfileFilter
+from apps.account.api.pagination.user import ProfileCursorPagination
 from apps.account.api.serializers.user import RegisterUserSerializer, ProfileSerializer, BlackListSerializer, \
     UserListSerializer, LogoutSerializer
 
@@ -36,6 +39,26 @@ class ProfileListView(ListAPIView):
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['username', 'first_name', 'last_name']
     filterset_class = ProfileFilter
+    pagination_class = ProfileCursorPagination
+    search_limit = 10
+    max_search_limit = 50
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        query = self.request.query_params.get('q')
+        if query is None:
+            return queryset
+        try:
+            limit = int(self.request.query_params.get('limit', self.search_limit))
+        except ValueError:
+            limit = self.search_limit
+        return search_profiles(query, max(1, min(limit, self.max_search_limit)), queryset)
+
+    def paginate_queryset(self, queryset):
+        # Type-ahead results are already capped by ``limit``.
+        if 'q' in self.request.query_params:
+            return None
+        return super().paginate_queryset(queryset)
 
 class LogoutUserView(APIView):
     permission_classes = (IsAuthenticated,)
@@ -69,6 +92,7 @@ class BlackListAPIView(APIView):
             user_to_block = Profile.objects.filter(username=user).first()
             if user_to_block:
                 request.user.blacklist.add(user_to_block)
+                invalidate_blacklist(request.user.pk, user_to_block.pk)
                 return Response({"detail": f"{user_to_block.username} بلاک شد."}, status=status.HTTP_200_OK)
             return Response("این کاربر وجود ندارد")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -79,6 +103,7 @@ class BlackListAPIView(APIView):
             user_to_block = Profile.objects.filter(username=user).first()
             if user_to_block:
                 request.user.blacklist.remove(user_to_block)
+                invalidate_blacklist(request.user.pk, user_to_block.pk)
                 return Response({"detail": f"{user_to_block.username} انبلاک شد."}, status=status.HTTP_200_OK)
             return Response("این کاربر وجود ندارد")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
@@ -0,0 +1,71 @@
+import time
+import random
+
+from django.db import transaction
+from django.db.models import Q
+from django.core.management.base import BaseCommand
+
+from apps.account.models import Profile
+from apps.account.services.search import index_profiles, search_profiles
+
+FIRST_NAMES = ['علی', 'محمد', 'زهرا', 'فاطمه', 'رضا', 'مریم', 'sara', 'john', 'maria', 'david']
+LAST_NAMES = ['احمدی', 'محمدی', 'حسینی', 'رضایی', 'کریمی', 'smith', 'garcia', 'miller', 'brown', 'wilson']
+USERNAME_PREFIX = 'benchuser'
+
+
+class Command(BaseCommand):
+    help = (
+        "Create synthetic profiles and compare type-ahead latency of the indexed "
+        "search against the old icontains filter. Run against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=1_000_000, help="Number of synthetic profiles.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--queries', type=int, default=50, help="Lookups timed per method.")
+        parser.add_argument('--keep', action='store_true', help="Keep the profiles for later runs.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        started = time.perf_counter()
+        self.fill(options['profiles'], options['batch_size'], rng)
+        self.stdout.write(f"created and indexed {options['profiles']} profiles in {time.perf_counter() - started:.1f}s")
+
+        # Type-ahead prefixes of existing usernames, two to six characters past the shared prefix.
+        queries = [
+            f"{USERNAME_PREFIX}{rng.randrange(options['profiles'])}"[:rng.randint(11, 15)]
+            for _ in range(options['queries'])
+        ]
+        indexed = self.measure(queries, lambda q: list(search_profiles(q, 10)))
+        scanned = self.measure(queries, lambda q: list(
+            Profile.objects.filter(
+                Q(username__icontains=q) | Q(first_name__icontains=q) | Q(last_name__icontains=q)
+            ).order_by('username')[:10]
+        ))
+        self.stdout.write(f"{'method':>10} {'avg ms':>10}")
+        self.stdout.write(f"{'indexed':>10} {indexed:>10.1f}")
+        self.stdout.write(f"{'icontains':>10} {scanned:>10.1f}")
+
+        if not options['keep']:
+            Profile.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+
+    def fill(self, total, batch_size, rng):
+        for start in range(0, total, batch_size):
+            profiles = [
+                Profile(
+                    username=f"{USERNAME_PREFIX}{i}",
+                    first_name=rng.choice(FIRST_NAMES),
+                    last_name=rng.choice(LAST_NAMES),
+                )
+                for i in range(start, min(start + batch_size, total))
+            ]
+            # bulk_create skips post_save, so the terms are written here.
+            with transaction.atomic():
+                Profile.objects.bulk_create(profiles)
+                index_profiles(profiles)
+
+    def measure(self, queries, search):
+        started = time.perf_counter()
+        for query in queries:
+            search(query)
+        return (time.perf_counter() - started) / len(queries) * 1000
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copies of apps.account.services.search as of this migration, so later
+# changes to the live helpers do not change what it writes.
+SEARCH_FIELDS = ('username', 'first_name', 'last_name')
+CHARACTER_MAP = str.maketrans({'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', '\u200c': ' '})
+BATCH_SIZE = 1000
+
+
+def normalize(text):
+    return ' '.join(text.translate(CHARACTER_MAP).casefold().split())
+
+
+def profile_terms(profile):
+    terms = set()
+    for field in SEARCH_FIELDS:
+        terms.update(normalize(getattr(profile, field) or '').split())
+    return terms
+
+
+def backfill_search_terms(apps, schema_editor):
+    Profile = apps.get_model('account', 'Profile')
+    ProfileSearchTerm = apps.get_model('account', 'ProfileSearchTerm')
+    pending = []
+    for profile in Profile.objects.only('id', *SEARCH_FIELDS).iterator(chunk_size=BATCH_SIZE):
+        pending += [ProfileSearchTerm(profile_id=profile.pk, term=term) for term in profile_terms(profile)]
+        if len(pending) >= BATCH_SIZE:
+            ProfileSearchTerm.objects.bulk_create(pending, batch_size=BATCH_SIZE)
+            pending = []
+    ProfileSearchTerm.objects.bulk_create(pending, batch_size=BATCH_SIZE)
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX profile_search_term_trgm_idx ON account_profilesearchterm USING GIN (term gin_trgm_ops)"
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS profile_search_term_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=150)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'واژه جستجوی کاربر',
+                'verbose_name_plural': 'واژه\u200cهای جستجوی کاربران',
+                'indexes': [models.Index(fields=['term', 'profile'], name='profile_search_term_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_search_terms, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -33,3 +33,14 @@ class Profile(AbstractUser):
         return self.username
 
 
+class ProfileSearchTerm(models.Model):
+    # One normalized word of a profile's username or name; a prefix search is an index range scan on term.
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="search_terms")
+    term = models.CharField(max_length=150)
+
+    class Meta:
+        verbose_name = "واژه جستجوی کاربر"
+        verbose_name_plural = "واژه‌های جستجوی کاربران"
+        indexes = [
+            models.Index(fields=["term", "profile"], name="profile_search_term_idx"),
+        ]
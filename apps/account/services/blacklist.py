@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from apps.account.models import Profile
+
+
+def blacklist_cache_key(user_id):
+    return f'profile:{user_id}:blacklist'
+
+
+def get_blacklist(user_id):
+    """
+    ``{'blocked': ids user_id has blocked, 'blocked_by': ids that blocked user_id}``,
+    cached per user and loaded with a single query on a miss.
+    """
+    key = blacklist_cache_key(user_id)
+    entry = cache.get(key)
+    if entry is None:
+        entry = {'blocked': set(), 'blocked_by': set()}
+        rows = Profile.blacklist.through.objects.filter(
+            Q(from_profile_id=user_id) | Q(to_profile_id=user_id)
+        ).values_list('from_profile_id', 'to_profile_id')
+        for blocker_id, blocked_id in rows:
+            if blocker_id == user_id:
+                entry['blocked'].add(blocked_id)
+            if blocked_id == user_id:
+                entry['blocked_by'].add(blocker_id)
+        cache.set(key, entry, settings.BLACKLIST_CACHE_TIMEOUT)
+    return entry
+
+
+def is_blocked_by(user_id, blocker_id):
+    return blocker_id in get_blacklist(user_id)['blocked_by']
+
+
+def invalidate_blacklist(*user_ids):
+    cache.delete_many([blacklist_cache_key(user_id) for user_id in user_ids])
@@ -0,0 +1,50 @@
+from django.db import connection, transaction
+
+from apps.account.models import Profile, ProfileSearchTerm
+
+SEARCH_FIELDS = ('username', 'first_name', 'last_name')
+# Arabic code points that Persian keyboards and older clients still produce.
+CHARACTER_MAP = str.maketrans({'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', '\u200c': ' '})
+# Sorts after every character a term can contain, so [prefix, prefix + END) is the prefix range.
+PREFIX_END = '\U0010ffff'
+
+
+def normalize(text):
+    return ' '.join(text.translate(CHARACTER_MAP).casefold().split())
+
+
+def profile_terms(profile):
+    terms = set()
+    for field in SEARCH_FIELDS:
+        terms.update(normalize(getattr(profile, field) or '').split())
+    return terms
+
+
+def index_profiles(profiles):
+    profiles = list(profiles)
+    with transaction.atomic():
+        ProfileSearchTerm.objects.filter(profile__in=profiles).delete()
+        ProfileSearchTerm.objects.bulk_create(
+            [ProfileSearchTerm(profile=profile, term=term) for profile in profiles for term in profile_terms(profile)],
+            batch_size=1000,
+        )
+
+
+def search_profiles(text, limit, queryset=None):
+    """
+    Type-ahead lookup: every word of ``text`` has to match a word of the
+    profile's username or name. SQLite matches word prefixes with a range
+    scan on profile_search_term_idx; PostgreSQL matches substrings through
+    the pg_trgm index on the same column.
+    """
+    queryset = Profile.objects.all() if queryset is None else queryset
+    words = normalize(text).split()
+    if not words:
+        return queryset.none()
+    for word in words:
+        if connection.vendor == 'postgresql':
+            terms = ProfileSearchTerm.objects.filter(term__contains=word)
+        else:
+            terms = ProfileSearchTerm.objects.filter(term__gte=word, term__lt=word + PREFIX_END)
+        queryset = queryset.filter(id__in=terms.values('profile_id'))
+    return queryset.order_by('username')[:limit]
@@ -0,0 +1,24 @@
+from django.dispatch import receiver
+from django.db.models.signals import m2m_changed, post_save
+
+from apps.account.models import Profile
+from apps.account.services.search import SEARCH_FIELDS, index_profiles
+from apps.account.services.blacklist import invalidate_blacklist
+
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, created, update_fields, **kwargs):
+    # Logins save with update_fields=['last_login']; only name changes touch the search terms.
+    if update_fields is not None and not set(update_fields) & set(SEARCH_FIELDS):
+        return
+    index_profiles([instance])
+
+
+@receiver(m2m_changed, sender=Profile.blacklist.through)
+def blacklist_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if pk_set is None:
+        related = instance.blocked_by if reverse else instance.blacklist
+        pk_set = set(related.values_list('id', flat=True))
+    invalidate_blacklist(instance.pk, *pk_set)
@@ -3,4 +3,7 @@ from django.contrib import admin
 from .models import *
 
 admin.site.register(Chat)
-admin.site.register(Message)
\ No newline at end of file
+admin.site.register(Message)
+admin.site.register(ReadState)
+admin.site.register(SyncEvent)
+admin.site.register(OutboxEvent)
@@ -0,0 +1,48 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+
+from rest_framework import status
+from rest_framework.response import Response
+
+from apps.chat.services.versions import get_inbox_version
+
+
+def user_etag(request):
+    # Derived from chat versions alone, so it is known before the view runs.
+    version = get_inbox_version(request.user.pk)
+    key = f"{version}|{request.build_absolute_uri()}|{request.META.get('HTTP_ACCEPT', '')}"
+    return '"%s"' % hashlib.sha1(key.encode()).hexdigest()
+
+
+def cached_per_user(view_method):
+    """
+    Wraps a GET handler whose output only changes when the user's chat
+    version, or that of a channel they follow, is bumped (favorites,
+    membership, new messages, read cursor).
+
+    A matching If-None-Match gets 304 without running the handler; otherwise
+    the response data is served from, or stored in, the cache under the ETag.
+    """
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        etag = user_etag(request)
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        key = f'response:{request.user.pk}:{etag}'
+        data = cache.get(key)
+        if data is not None:
+            return Response(data, headers={'ETag': etag})
+
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.CHAT_RESPONSE_CACHE_TIMEOUT)
+            response['ETag'] = etag
+        return response
+
+    return wrapper
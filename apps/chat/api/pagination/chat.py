@@ -0,0 +1,214 @@
+import json
+import base64
+import binascii
+
+from django.db.models import Q
+from django.core.exceptions import ValidationError
+
+from rest_framework.response import Response
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek pagination over a fixed multi-column ordering.
+
+    The cursor is the ordering values of the last row on the page, so every
+    page is a single index range scan no matter how deep the client pages.
+    """
+    ordering = ('-id',)
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, position):
+        # str() keeps full microsecond precision, which the keyset comparison needs.
+        data = json.dumps(position, default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, encoded):
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def clean_position(self, position, model):
+        # Cursors come from the client: every value must convert to its column's type before it reaches a filter.
+        if position is None:
+            return None
+        try:
+            cleaned = [model._meta.get_field(field.lstrip('-')).to_python(value)
+                       for field, value in zip(self.ordering, position)]
+        except (ValidationError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in cleaned:
+            raise NotFound(self.invalid_cursor_message)
+        return cleaned
+
+    def get_position(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def keyset_filter(self, position, reverse=False):
+        # (a, b) after (x, y)  ==  a > x OR (a = x AND b > y), per column direction.
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            step = Q(**{f.lstrip('-'): v for f, v in zip(self.ordering[:i], position[:i])})
+            step &= Q(**{f"{name}__{'lt' if descending else 'gt'}": position[i]})
+            condition |= step
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+        position = self.clean_position(position, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position))
+
+        rows = list(queryset.order_by(*self.ordering)[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_position = self.get_position(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class InboxPagination(KeysetPagination):
+    ordering = ('-last_message_at', '-id')
+
+
+class MessageHistoryPagination(KeysetPagination):
+    """
+    Two-way keyset over (timestamp, id): ``before`` walks back into older
+    history, ``after`` picks up what arrived since. Pages are returned in
+    chronological order either way.
+    """
+    ordering = ('-timestamp', '-id')
+    before_query_param = 'before'
+    after_query_param = 'after'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        before, self.after = (
+            self.clean_position(self.decode_cursor(request.query_params.get(param)), queryset.model)
+            for param in (self.before_query_param, self.after_query_param)
+        )
+
+        if self.after is not None:
+            newer = queryset.filter(self.keyset_filter(self.after, reverse=True))
+            rows = list(newer.order_by(*[field.lstrip('-') for field in self.ordering])[:page_size])
+            # Usually the cursor's own row, unless it was deleted and nothing else precedes the page.
+            self.has_older = bool(rows) and queryset.filter(self.keyset_filter(self.get_position(rows[0]))).exists()
+        else:
+            if before is not None:
+                queryset = queryset.filter(self.keyset_filter(before))
+            rows = list(queryset.order_by(*self.ordering)[:page_size + 1])
+            self.has_older = len(rows) > page_size
+            rows = rows[:page_size]
+            rows.reverse()
+
+        self.rows = rows
+        return rows
+
+    def paginate_recent(self, recent, complete, request):
+        """
+        Serve the newest page from ``recent``, a cached newest-first window
+        of the chat (the whole chat when ``complete``). Returns None when the
+        window cannot answer the request; the caller then falls back to
+        paginate_queryset.
+        """
+        params = request.query_params
+        if self.before_query_param in params or self.after_query_param in params:
+            return None
+        page_size = self.get_page_size(request)
+        if len(recent) <= page_size and not complete:
+            return None
+        self.request = request
+        self.after = None
+        self.has_older = len(recent) > page_size
+        self.rows = list(reversed(recent[:page_size]))
+        return self.rows
+
+    def get_link(self, param, position):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.before_query_param)
+        url = remove_query_param(url, self.after_query_param)
+        return replace_query_param(url, param, self.encode_cursor(position))
+
+    def get_older_link(self):
+        if not self.rows or not self.has_older:
+            return None
+        return self.get_link(self.before_query_param, self.get_position(self.rows[0]))
+
+    def get_newer_link(self):
+        # Always hand back a forward cursor so clients can poll for new messages.
+        if self.rows:
+            return self.get_link(self.after_query_param, self.get_position(self.rows[-1]))
+        if self.after is not None:
+            return self.get_link(self.after_query_param, self.after)
+        return None
+
+    def get_paginated_response(self, data):
+        return Response({
+            'older': self.get_older_link(),
+            'newer': self.get_newer_link(),
+            'results': data,
+        })
+
+
+class SearchPagination(KeysetPagination):
+    """
+    Pages over ranked search results. Rank is not unique or stable enough to
+    seek on, so the opaque cursor carries an offset instead.
+    """
+    ordering = ('-rank',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+        offset = position[0] if position is not None else 0
+        if not isinstance(offset, int) or offset < 0:
+            raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.next_position = [offset + page_size] if self.has_next else None
+        return rows[:page_size]
+
+
+class ChatListPagination(CursorPagination):
+    ordering = '-id'
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
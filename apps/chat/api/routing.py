@@ -1,8 +1,9 @@
 from django.urls import re_path
 
-from apps.chat.consumers import ChatConsumer
+from apps.chat.consumers import ChatConsumer, UserConsumer
 
 
 websocket_urlpatterns = [
-    re_path(r'ws/chat/(?P<chat_id>\w+)/$', ChatConsumer.as_asgi()),
+    re_path(r'ws/chat/(?P<chat_id>\d+)/$', ChatConsumer.as_asgi()),
+    re_path(r'ws/user/$', UserConsumer.as_asgi()),
 ]
\ No newline at end of file
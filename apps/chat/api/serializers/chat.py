@@ -1,13 +1,18 @@
 from rest_framework import serializers
 
 from apps.account.models import Profile
-from apps.chat.models import Message, Chat
+from apps.account.services.blacklist import get_blacklist
+from apps.account.api.serializers.mixins import SparseFieldsMixin
+from apps.chat.models import Message, Chat, ReadState, SyncEvent
+from apps.chat.services.permissions import PostDenied, check_can_post
+
+MAX_BULK_PARTICIPANTS = 10000
 
 
 class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
-        fields = ["id", "chat", "message", "timestamp","sender"]
+        fields = ["id", "uid", "chat", "message", "timestamp","sender"]
         read_only_fields = ["sender"]
     def validate(self, data):
         sender = self.context["request"].user
@@ -15,39 +20,69 @@ class MessageSerializer(serializers.ModelSerializer):
         if not chat:
             raise serializers.ValidationError("ایدی چت را وارد کنید")
 
-        if sender not in chat.participants.all():
-            raise serializers.ValidationError("شما عضو این چت نیستید و نمی‌توانید پیام ارسال کنید.")
+        try:
+            check_can_post(chat.pk, sender.pk)
+        except PostDenied as exc:
+            raise serializers.ValidationError(exc.message)
+        return data
+
+class MessageEventSerializer(serializers.ModelSerializer):
+    # Shared by the MessageAPIView response and the WebSocket frames, so a message is serialized once.
+    chat_id = serializers.IntegerField(read_only=True)
+    sender_id = serializers.UUIDField(read_only=True)
+    body = serializers.CharField(source='message', read_only=True)
 
-        for participant in chat.participants.exclude(id=sender.id):
-            if sender in participant.blacklist.all():
-                raise serializers.ValidationError(
-                    f"شما بلاک شده‌اید از طرف {participant.username}. نمی‌توانید پیام ارسال کنید.")
+    class Meta:
+        model = Message
+        fields = ['id', 'uid', 'chat_id', 'seq', 'sender_id', 'body', 'timestamp']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # A write-behind message is announced before it is stored: it has no id or seq yet, so
+        # uid is the only key every event carries, and those clients count unread from the inbox.
+        if instance.pk is None:
+            del data['id'], data['seq']
         return data
 
+class MessageSearchResultSerializer(MessageEventSerializer):
+    rank = serializers.FloatField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+
+    class Meta(MessageEventSerializer.Meta):
+        fields = MessageEventSerializer.Meta.fields + ['rank', 'snippet']
+
 class ChatSerializer(serializers.ModelSerializer):
-    participants = serializers.PrimaryKeyRelatedField(many=True, queryset=Profile.objects.all())
+    participants = serializers.PrimaryKeyRelatedField(many=True, queryset=Profile.objects.all(), required=False)
     messages = MessageSerializer(many=True, read_only=True)
 
     class Meta:
         model = Chat
-        fields = ['id', 'name', 'participants', 'messages', 'created', 'is_group']
+        fields = ['id', 'name', 'participants', 'messages', 'created', 'is_group', 'is_broadcast']
 
     def validate(self, data):
         sender = self.context["request"].user
         is_group = self.context['request'].data.get("is_group", False)
         name = self.context["request"].data.get("name")
         participants_list= self.context['request'].data.get("participants", [])
+        is_broadcast = data.get("is_broadcast", False)
 
-        if not participants_list:
+        if not participants_list and not is_broadcast:
             raise serializers.ValidationError("حداقل یک شرکت‌کننده باید انتخاب شود.")
 
+        blocked_by = get_blacklist(sender.pk)['blocked_by']
         for participant_id in participants_list:
             participant = Profile.objects.filter(id=participant_id).first()
             if not participant:
                 raise serializers.ValidationError(f"کاربری با شناسه {participant_id} یافت نشد.")
-            if sender in participant.blacklist.all():
+            if participant.pk in blocked_by:
                 raise serializers.ValidationError(f"شما بلاک شده اید از طرف  {participant.username} . نمیتوانید پیام ارسال کنید.")
 
+        if is_broadcast:
+            if not name:
+                raise serializers.ValidationError("نام کانال را وارد کنید")
+            data["is_group"] = True
+            return data
+
         if not is_group:
             if len(participants_list) > 1:
                 raise serializers.ValidationError("چت خصوصی نمی‌تواند بیش از دو شرکت‌کننده داشته باشد.")
@@ -63,6 +98,63 @@ class ChatSerializer(serializers.ModelSerializer):
 
         return data
 
+class ChatSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # List-view shape: participants and messages are only loaded when named in ?fields=.
+    participants = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    messages = MessageSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Chat
+        fields = ['id', 'name', 'is_group', 'is_broadcast', 'created', 'last_message_at', 'message_count', 'participants',
+                  'messages']
+        optional_fields = ['participants', 'messages']
+
+class ChatInboxSerializer(serializers.ModelSerializer):
+    last_message_time = serializers.DateTimeField(source='last_message_at', read_only=True)
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Chat
+        fields = ['id', 'name', 'is_group', 'is_broadcast', 'created', 'last_message_time', 'last_message', 'unread_count']
+
+    def get_last_message(self, obj):
+        # Filled from the preview_* annotations of the inbox queryset, never from obj.messages.
+        if obj.last_message_id is None:
+            return None
+        return {
+            'id': obj.last_message_id,
+            'sender': obj.preview_sender,
+            'sender_username': obj.preview_sender_username,
+            'message': obj.preview_text,
+            'timestamp': obj.last_message_at,
+        }
+
+class ReadStateSerializer(serializers.ModelSerializer):
+    last_read_id = serializers.IntegerField(source='last_read_message_id', read_only=True)
+    unread_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReadState
+        fields = ['chat_id', 'last_read_id', 'last_read_seq', 'unread_count']
+
+    def get_unread_count(self, obj):
+        return max(obj.chat.last_seq - obj.last_read_seq, 0)
+
+class SyncEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SyncEvent
+        fields = ['id', 'kind', 'chat_id', 'created']
+
+class MarkReadSerializer(serializers.Serializer):
+    message = serializers.IntegerField(required=False)
+
+    def validate_message(self, value):
+        chat_id = self.context['chat_id']
+        if not Message.objects.filter(id=value, chat_id=chat_id).exists():
+            raise serializers.ValidationError("پیام با این ایدی در این چت موجود نیست")
+        return value
+
 class ChatFavoriteSerializer(serializers.Serializer):
     id = serializers.IntegerField()
 
@@ -72,19 +164,8 @@ class ChatFavoriteSerializer(serializers.Serializer):
         return value
 
 class AddParticipantsToChatSerializer(serializers.Serializer):
+    # Unknown ids are not an error: add_members reports them per id.
     participants = serializers.ListField(
-        child=serializers.UUIDField(format='hex_verbose'), allow_empty=False
+        child=serializers.UUIDField(format='hex_verbose'), allow_empty=False, max_length=MAX_BULK_PARTICIPANTS,
     )
     id = serializers.IntegerField()
-
-    def validate_participants(self, value):
-        for participant_id in value:
-            if not Profile.objects.filter(id=participant_id).exists():
-                raise serializers.ValidationError(f"کاربر با UUID {participant_id} وجود ندارد.")
-        return value
-    def validate_id(self, value):
-        if not Chat.objects.filter(id=value).exists():
-            raise serializers.ValidationError("چت با این ایدی موجود نیست")
-        return value
-
-
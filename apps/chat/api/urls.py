@@ -1,13 +1,21 @@
 from django.urls import path
 
 from apps.chat.api.views.chat import ChatAPIView, MessageAPIView, AddParticipantsToChat, FavoriteChatListAPIView, \
-    ListChatFilterAPIView
+    ListChatFilterAPIView, MessageHistoryAPIView, IngestionMetricsAPIView, MarkChatReadAPIView, \
+    SyncAPIView, MessageSearchAPIView, WebSocketMetricsAPIView, BroadcastSubscriptionAPIView
 
 urlpatterns = [
     path('chat/', ChatAPIView.as_view(), name='chat'),
     path('message/', MessageAPIView.as_view(), name='message'),
+    path('chat/<int:chat_id>/messages/', MessageHistoryAPIView.as_view(), name='message-history'),
+    path('chat/<int:chat_id>/read/', MarkChatReadAPIView.as_view(), name='chat-read'),
+    path('search/messages/', MessageSearchAPIView.as_view(), name='message-search'),
+    path('sync/', SyncAPIView.as_view(), name='sync'),
+    path('chat/<int:chat_id>/subscribe/', BroadcastSubscriptionAPIView.as_view(), name='chat-subscribe'),
     path('add_participants/', AddParticipantsToChat.as_view(), name='add_participants'),
     path('favorite/', FavoriteChatListAPIView.as_view(), name='favorite'),
     path('filter/', ListChatFilterAPIView.as_view(), name='filter'),
+    path('ingestion/metrics/', IngestionMetricsAPIView.as_view(), name='ingestion-metrics'),
+    path('websocket/metrics/', WebSocketMetricsAPIView.as_view(), name='websocket-metrics'),
 
     ]
\ No newline at end of file
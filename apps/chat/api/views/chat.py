@@ -1,29 +1,60 @@
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 
-from django.db.models import Max
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Prefetch, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber, Substr
 from django_filters.rest_framework import DjangoFilterBackend
 
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.generics import ListAPIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 
 from apps.account.models import Profile
-from apps.chat.models import Chat, Message
+from apps.account.api.serializers.mixins import requested_fields
+from apps.chat.models import Chat, Message, ReadState
+from apps.chat.services.backpressure import outbound_metrics
+from apps.chat.services.broadcast import recent_timeline
+from apps.chat.services.ingestion import WRITE_BEHIND, get_ingestor, ingest_message
+from apps.chat.services.read_state import mark_read
+from apps.chat.services.membership import ADDED, NotMember, add_members
+from apps.chat.services.outbox import enqueue, outbox_enabled
+from apps.chat.services.search import MessageSearch
+from apps.chat.services.permissions import get_chat_admins
+from apps.chat.services.sync import InvalidSyncToken, changes_since, current_token
+from apps.chat.services.fanout import chat_groups, message_event, read_event, read_groups, send_to_groups
+from apps.chat.api.caching import cached_per_user
 from apps.chat.api.filters.chat import ChatFilter
+from apps.chat.api.pagination.chat import InboxPagination, MessageHistoryPagination, SearchPagination, \
+    ChatListPagination
 from apps.chat.api.serializers.chat import ChatSerializer, MessageSerializer, ChatFavoriteSerializer, \
-    AddParticipantsToChatSerializer
+    AddParticipantsToChatSerializer, ChatInboxSerializer, MessageEventSerializer, MarkReadSerializer, \
+    ReadStateSerializer, SyncEventSerializer, MessageSearchResultSerializer, ChatSummarySerializer
+
+PREVIEW_LENGTH = 100
+SYNC_PAGE_SIZE = 100
+SYNC_MAX_PAGE_SIZE = 500
 
 
 class ChatAPIView(APIView):
     permission_classes = (IsAuthenticated,)
 
+    @cached_per_user
     def get(self, request):
-        chats = Chat.objects.annotate(last_message_time=Max('messages__timestamp')).order_by('-last_message_time')
-        serializer = ChatSerializer(chats, many=True)
-        return Response(serializer.data)
+        last_read_seq = ReadState.objects.filter(chat=OuterRef('pk'), user=request.user).values('last_read_seq')[:1]
+        chats = request.user.chats.annotate(
+            unread_count=F('last_seq') - Coalesce(Subquery(last_read_seq), 0),
+            preview_sender=F('last_message__sender'),
+            preview_sender_username=F('last_message__sender__username'),
+            preview_text=Substr('last_message__message', 1, PREVIEW_LENGTH),
+        )
+        paginator = InboxPagination()
+        page = paginator.paginate_queryset(chats, request, view=self)
+        serializer = ChatInboxSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request):
         serializer = ChatSerializer(data=request.data, context={'request': request})
@@ -33,28 +64,51 @@ class ChatAPIView(APIView):
             participants = serializer.validated_data.get('participants',[])
             create_by = request.user
 
-            chat = Chat.objects.create(name=chat_name, create_by=create_by, is_group=is_group)
+            is_broadcast = serializer.validated_data.get('is_broadcast', False)
+
+            chat = Chat.objects.create(name=chat_name, create_by=create_by, is_group=is_group, is_broadcast=is_broadcast)
             chat.participants.add(*participants)
             chat.participants.add(create_by)
+            if is_broadcast:
+                chat.admins.add(create_by)
 
             return Response({"detail": "چت ساخته شد."}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def latest_messages(limit):
+    # The newest ``limit`` messages of every chat in one query, oldest first within each chat.
+    newest_first = Window(RowNumber(), partition_by=F('chat_id'), order_by=(F('timestamp').desc(), F('id').desc()))
+    return Message.objects.annotate(row_number=newest_first).filter(row_number__lte=limit).order_by('timestamp', 'id')
+
 class ListChatFilterAPIView(ListAPIView):
     permission_classes = (IsAuthenticated,)
-    serializer_class = ChatSerializer
-    queryset = Chat.objects.all()
+    serializer_class = ChatSummarySerializer
+    pagination_class = ChatListPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['is_group']
     filterset_class = ChatFilter
 
+    messages_limit = 20
+
+    def get_queryset(self):
+        chats = self.request.user.chats.all()
+        fields = requested_fields(self.request) or ()
+        if 'participants' in fields:
+            chats = chats.prefetch_related(Prefetch('participants', queryset=Profile.objects.only('id')))
+        if 'messages' in fields:
+            chats = chats.prefetch_related(Prefetch('messages', queryset=latest_messages(self.messages_limit)))
+        return chats
+
+    @cached_per_user
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 class MessageAPIView(APIView):
     permission_classes = (IsAuthenticated,)
 
     def post(self, request, *args, **kwargs):
         serializer = MessageSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
-            user = request.user
             message_content = request.data.get('message')
             chat_id = request.data.get('chat')
             chat = request.user.chats.filter(id=chat_id).first()
@@ -67,53 +121,153 @@ class MessageAPIView(APIView):
                 if sender == chat_name:
                     chat_name = participant.username
             if chat :
-                message = Message.objects.create(
-                chat=chat,
-                sender=request.user,
-                message=message_content,)
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    f"chat_{chat_id}",
-                    {
-                        "type": "chat_message",
-                        "message": f"{user.username}: {message_content}, Chat_Name: {chat_name}, Chat_id: {chat_id}"
-                    }
-                )
+                message = ingest_message(chat.pk, request.user, message_content)
+                data = MessageEventSerializer(message).data
+                # With the outbox the event was stored alongside the message and the relay sends it.
+                if not outbox_enabled():
+                    channel_layer = get_channel_layer()
+                    async_to_sync(send_to_groups)(channel_layer, chat_groups(chat.pk), message_event(data))
             else:
                 return Response(
                     {"detail": "چت یافت نشد یا شما عضو این چت نیستید."},
                     status=status.HTTP_404_NOT_FOUND,
                 )
             return Response(
-                {"detail": "پیام ارسال شد.", "message": MessageSerializer(message).data, "chat": chat_name},
+                {"detail": "پیام ارسال شد.", "message": data, "chat": chat_name},
                 status=status.HTTP_201_CREATED,
             )
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+class MessageHistoryAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, chat_id):
+        broadcast = request.user.chats.filter(id=chat_id).values_list('is_broadcast', flat=True).first()
+        if broadcast is None:
+            return Response(
+                {"detail": "چت یافت نشد یا شما عضو این چت نیستید."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        paginator = MessageHistoryPagination()
+        page = None
+        if broadcast:
+            # Subscribers opening a channel all read the same cached window.
+            recent = recent_timeline(chat_id)
+            page = paginator.paginate_recent(recent, len(recent) <= settings.CHAT_BROADCAST_TIMELINE_SIZE, request)
+        if page is None:
+            page = paginator.paginate_queryset(Message.objects.filter(chat_id=chat_id), request, view=self)
+        serializer = MessageSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+class MessageSearchAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"detail": "عبارت جستجو را وارد کنید."}, status=status.HTTP_400_BAD_REQUEST)
+        chat_id = request.query_params.get('chat')
+        if chat_id is not None and not chat_id.isdigit():
+            return Response({"detail": "ایدی چت نامعتبر است."}, status=status.HTTP_400_BAD_REQUEST)
+        search = MessageSearch(request.user, query, chat_id=chat_id and int(chat_id))
+        paginator = SearchPagination()
+        page = paginator.paginate_queryset(search, request, view=self)
+        serializer = MessageSearchResultSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+class MarkChatReadAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, chat_id):
+        if not request.user.chats.filter(id=chat_id).exists():
+            return Response(
+                {"detail": "چت یافت نشد یا شما عضو این چت نیستید."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        serializer = MarkReadSerializer(data=request.data, context={'chat_id': chat_id})
+        if serializer.is_valid():
+            if outbox_enabled():
+                with transaction.atomic():
+                    state = mark_read(request.user.pk, chat_id, serializer.validated_data.get('message'))
+                    enqueue([(read_groups(chat_id, request.user.pk), read_event(state))])
+            else:
+                state = mark_read(request.user.pk, chat_id, serializer.validated_data.get('message'))
+                channel_layer = get_channel_layer()
+                async_to_sync(send_to_groups)(channel_layer, read_groups(chat_id, request.user.pk), read_event(state))
+            return Response(ReadStateSerializer(state).data, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class SyncAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        token = request.query_params.get('token')
+        if not token:
+            # First sync: the client loads its state from the regular endpoints and keeps this token.
+            return Response({"token": current_token(request.user), "messages": [], "events": [], "has_more": False})
+        try:
+            limit = min(int(request.query_params.get('limit', SYNC_PAGE_SIZE)), SYNC_MAX_PAGE_SIZE)
+        except ValueError:
+            limit = SYNC_PAGE_SIZE
+        limit = max(limit, 1)
+        try:
+            messages, events, next_token, has_more = changes_since(request.user, token, limit)
+        except InvalidSyncToken:
+            return Response({"detail": "توکن همگام‌سازی نامعتبر است."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "token": next_token,
+            "messages": MessageEventSerializer(messages, many=True).data,
+            "events": SyncEventSerializer(events, many=True).data,
+            "has_more": has_more,
+        })
+
 class AddParticipantsToChat(APIView):
     permission_classes = (IsAuthenticated,)
 
     def post(self, request):
         serializer = AddParticipantsToChatSerializer(data=request.data)
         if serializer.is_valid():
-            chat_id = request.data.get('id')
-            chat = Chat.objects.filter(id=chat_id).first()
-            is_group = chat.is_group
-            if is_group is True:
-                participants = request.data.get('participants')
-                for participant in participants:
-                    if chat.participants.filter(id=participant).exists():
-                        return Response({"این فرد عضو گروه هست"})
-                    if chat.participants.filter(id=request.user.id).exists():
-                        chat.participants.add(*participants)
-                        return Response({"detail":"به گروه اضافه شد."}, status=status.HTTP_200_OK)
-                    return Response({"detail":"شما عضو گروه نیستید."}, status=status.HTTP_400_BAD_REQUEST)
-            return Response({"detail":"این چت شخصی است و شما امکان اضافه کردن کاربر را ندارین"}, status=status.HTTP_400_BAD_REQUEST)
+            chat = Chat.objects.filter(id=serializer.validated_data['id']).first()
+            if chat is None:
+                return Response({"id": ["چت با این ایدی موجود نیست"]}, status=status.HTTP_400_BAD_REQUEST)
+            if not chat.is_group:
+                return Response({"detail":"این چت شخصی است و شما امکان اضافه کردن کاربر را ندارین"}, status=status.HTTP_400_BAD_REQUEST)
+            if chat.is_broadcast and request.user.pk not in get_chat_admins(chat.pk):
+                return Response({"detail":"فقط مدیران کانال می‌توانند عضو اضافه کنند."}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                results = add_members(chat, serializer.validated_data['participants'], added_by=request.user.pk)
+            except NotMember:
+                return Response({"detail":"شما عضو گروه نیستید."}, status=status.HTTP_400_BAD_REQUEST)
+            added = sum(result['status'] == ADDED for result in results)
+            return Response({"detail":"به گروه اضافه شد.", "added": added, "results": results}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+class BroadcastSubscriptionAPIView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    def get_channel(self, chat_id):
+        return Chat.objects.filter(id=chat_id, is_broadcast=True).first()
+
+    def post(self, request, chat_id):
+        chat = self.get_channel(chat_id)
+        if chat is None:
+            return Response({"detail": "کانال یافت نشد."}, status=status.HTTP_404_NOT_FOUND)
+        [result] = add_members(chat, [request.user.pk])
+        if result['status'] == ADDED:
+            return Response({"detail": "عضو کانال شدید."}, status=status.HTTP_201_CREATED)
+        return Response({"detail": "شما عضو این کانال هستید."}, status=status.HTTP_200_OK)
+
+    def delete(self, request, chat_id):
+        chat = self.get_channel(chat_id)
+        if chat is None:
+            return Response({"detail": "کانال یافت نشد."}, status=status.HTTP_404_NOT_FOUND)
+        chat.participants.remove(request.user)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 class FavoriteChatListAPIView(APIView) :
     permission_classes = (IsAuthenticated,)
 
+    @cached_per_user
     def get(self, request):
         favorite_chats = request.user.favorits.all()
         serializer = ChatFavoriteSerializer(favorite_chats, many=True)
@@ -141,4 +295,19 @@ class FavoriteChatListAPIView(APIView) :
                 return Response({"detail": "چت از علاقه مندی ها حذف شد."}, status=status.HTTP_200_OK)
             else:
                 return Response({"detail": "شما عضو این چت نیستید."}, status=status.HTTP_400_BAD_REQUEST)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class IngestionMetricsAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        if settings.CHAT_INGESTION_MODE != WRITE_BEHIND:
+            return Response({"mode": settings.CHAT_INGESTION_MODE})
+        return Response({"mode": WRITE_BEHIND, **get_ingestor().metrics()})
+
+class WebSocketMetricsAPIView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        # Counters of this worker process only.
+        return Response({"overflow_policy": settings.CHAT_WS_OVERFLOW_POLICY, **outbound_metrics()})
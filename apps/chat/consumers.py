@@ -1,45 +1,335 @@
 import json
+import asyncio
+from urllib.parse import parse_qs
 
+from django.conf import settings
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from apps.chat.services import backpressure
+from apps.chat.services.encoding import dumps
+from apps.chat.services.backpressure import OutboundQueue, SlowConsumer
+from apps.chat.services.broadcast import get_user_broadcasts
+from apps.chat.services.ingestion import ingest_message
+from apps.chat.services.outbox import RecentIds, outbox_enabled
+from apps.chat.services.presence import get_presence_store, user_connected, user_disconnected, user_typing
+from apps.chat.services.fanout import EVENT_VERSION, chat_group_for, chat_groups, compact, compact_frame, \
+    message_event, send_to_groups, user_group_name
+from apps.chat.services.permissions import PostDenied, check_can_post_cached
+from apps.chat.api.serializers.chat import MessageEventSerializer
+
+
+# Application close code (4000-4999) for connections dropped by the "disconnect" overflow policy.
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+
+def query_flag(scope, name):
+    values = parse_qs(scope.get('query_string', b'').decode()).get(name)
+    return bool(values) and values[-1].lower() in ('1', 'true', 'yes')
+
+
+class FrameBatchingMixin:
+    """
+    Coalesces outgoing event frames for clients that connect with ``?batch=1``.
+
+    Events arriving within CHAT_WS_BATCH_WINDOW_MS of the first buffered one,
+    up to CHAT_WS_BATCH_MAX_SIZE, go out as a single JSON array frame. The
+    buffered frames are already encoded, so the array is built by joining
+    them rather than re-encoding. Clients without the flag get one frame per
+    event as before.
+    """
+
+    def setup_batching(self):
+        self.batching = query_flag(self.scope, 'batch')
+        self.batch = []
+        self.batch_flush_task = None
+
+    async def send_frame(self, frame):
+        if not self.batching:
+            await self.send(text_data=frame)
+            return
+        self.batch.append(frame)
+        if len(self.batch) >= settings.CHAT_WS_BATCH_MAX_SIZE:
+            await self.flush_batch()
+        elif self.batch_flush_task is None:
+            self.batch_flush_task = asyncio.create_task(self.flush_batch_later())
+
+    async def flush_batch_later(self):
+        await asyncio.sleep(settings.CHAT_WS_BATCH_WINDOW_MS / 1000)
+        self.batch_flush_task = None
+        await self.flush_batch()
+
+    async def flush_batch(self):
+        if self.batch_flush_task is not None and self.batch_flush_task is not asyncio.current_task():
+            self.batch_flush_task.cancel()
+        self.batch_flush_task = None
+        frames, self.batch = self.batch, []
+        if frames:
+            await self.send(text_data='[' + ','.join(frames) + ']')
+
+    def stop_batching(self):
+        if self.batch_flush_task is not None:
+            self.batch_flush_task.cancel()
+            self.batch_flush_task = None
+        self.batch = []
+
+
+class OutboundQueueMixin:
+    """
+    Decouples reading the channel layer from writing the socket.
+
+    Event handlers only push encoded frames onto a bounded per-connection
+    OutboundQueue and return, so a slow reader never stalls the consumer's
+    channel-layer receive loop; a writer task drains the queue into the
+    socket. What happens on overflow is CHAT_WS_OVERFLOW_POLICY.
+    """
+
+    def setup_outbound(self):
+        self.outbound = OutboundQueue(settings.CHAT_WS_OUTBOUND_QUEUE_SIZE, settings.CHAT_WS_OVERFLOW_POLICY)
+        self.outbound_ready = asyncio.Event()
+        self.outbound_task = None
+        backpressure.stats['connections'] += 1
+
+    async def send_frame(self, frame):
+        if self.outbound is None:
+            return
+        try:
+            self.outbound.push(frame)
+        except SlowConsumer:
+            self.stop_outbound()
+            await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+            return
+        if self.outbound_task is None:
+            self.outbound_task = asyncio.create_task(self.drain_outbound())
+        self.outbound_ready.set()
+
+    async def drain_outbound(self):
+        while True:
+            await self.outbound_ready.wait()
+            self.outbound_ready.clear()
+            while self.outbound:
+                await super().send_frame(self.outbound.pop())
+
+    def stop_outbound(self):
+        if getattr(self, 'outbound', None) is None:
+            return
+        if self.outbound_task is not None:
+            self.outbound_task.cancel()
+        self.outbound.clear()
+        self.outbound = None
+        backpressure.stats['connections'] -= 1
+
+
+class PresenceMixin:
+    """
+    Online/offline and typing indicators for the chat this connection is in.
+
+    Every connection heartbeats the presence store on connect and then every
+    third of CHAT_PRESENCE_TTL for as long as the socket is open, so the
+    entry only lapses if the worker dies; ``{"type": "heartbeat"}`` frames
+    are still accepted but no longer needed. Only
+    connections opened with ``?presence=1`` receive presence and typing
+    frames, starting with a snapshot of who is online.
+    """
+
+    def setup_presence(self):
+        self.presence = query_flag(self.scope, 'presence')
+        self.presence_user_id = str(self.user.pk)
+        self.presence_joined = False
+        self.keep_alive_task = None
+
+    async def join_presence(self):
+        self.presence_joined = True
+        await self.heartbeat()
+        self.keep_alive_task = asyncio.create_task(self.keep_alive())
+        if self.presence:
+            online = await get_presence_store().online_users(self.chat.pk)
+            snapshot = {
+                'v': EVENT_VERSION, 'type': 'presence_snapshot', 'chat_id': self.chat.pk, 'user_ids': sorted(online),
+            }
+            await self.send(text_data=dumps(compact(snapshot) if self.compact else snapshot))
+
+    async def leave_presence(self):
+        if self.presence_joined:
+            self.presence_joined = False
+            self.keep_alive_task.cancel()
+            await user_disconnected(self.channel_layer, self.chat.pk, self.presence_user_id, self.channel_name)
+
+    async def heartbeat(self):
+        await user_connected(self.channel_layer, self.chat.pk, self.presence_user_id, self.channel_name)
 
+    async def keep_alive(self):
+        interval = settings.CHAT_PRESENCE_TTL / 3
+        while True:
+            await asyncio.sleep(interval)
+            await self.heartbeat()
 
-class ChatConsumer(AsyncWebsocketConsumer):
+    async def typing(self):
+        await user_typing(self.channel_layer, self.chat.pk, self.presence_user_id)
+
+    async def chat_presence(self, event):
+        # Nobody needs to hear about their own status or typing.
+        if self.presence and event['user_ids'] != [self.presence_user_id]:
+            await self.send_frame(compact_frame(event['frame']) if self.compact else event['frame'])
+
+
+class MessagingMixin:
+    """Posting messages and forwarding chat events, shared by the per-chat and per-user sockets."""
+
+    async def post_message(self, chat_id, body, client_id):
+        try:
+            data, groups = await self.store_message(chat_id, body)
+        except PostDenied as exc:
+            await self.send_error(exc.message, client_id)
+            return False
+
+        if groups is not None:
+            await send_to_groups(self.channel_layer, groups, message_event(data))
+        ack = {
+            'type': 'ack',
+            'id': data.get('id'),
+            'uid': data['uid'],
+            'chat_id': chat_id,
+            'client_id': client_id,
+            'timestamp': data['timestamp'],
+        }
+        if ack['id'] is None:
+            del ack['id']
+        await self.send(text_data=dumps(ack))
+        return True
+
+    @database_sync_to_async
+    def store_message(self, chat_id, body):
+        check_can_post_cached(chat_id, self.user.pk)
+        stored = ingest_message(chat_id, self.user, body)
+        # No groups in outbox mode: the relay sends the event once the message is committed.
+        return MessageEventSerializer(stored).data, None if outbox_enabled() else chat_groups(chat_id)
+
+    def setup_messaging(self):
+        self.relayed = RecentIds(settings.CHAT_OUTBOX_DEDUPE_WINDOW)
+
+    async def chat_message(self, event):
+        if 'dedupe_id' in event and self.relayed.seen(event['dedupe_id']):
+            return
+        # Already encoded by the sender; forward as-is.
+        await self.send_frame(compact_frame(event['frame']) if self.compact else event['frame'])
+
+    async def send_error(self, detail, client_id=None):
+        await self.send(text_data=dumps({
+            'type': 'error',
+            'detail': detail,
+            'client_id': client_id,
+        }))
+
+
+class ChatConsumer(MessagingMixin, PresenceMixin, OutboundQueueMixin, FrameBatchingMixin, AsyncWebsocketConsumer):
 
     async def connect(self):
 
-        self.chat_id = self.scope['url_route']['kwargs']['chat_id']
-        self.chat_group_id = 'chat_%s' % self.chat_id
+        self.setup_batching()
+        self.setup_messaging()
+        self.compact = query_flag(self.scope, 'compact')
+        self.chat_id = int(self.scope['url_route']['kwargs']['chat_id'])
+        self.user = self.scope.get('user')
+
+        self.chat = await self.get_chat()
+        if self.chat is None:
+            await self.close()
+            return
+        self.setup_outbound()
+        self.setup_presence()
+        self.chat_group_id = chat_group_for(self.chat.pk, self.channel_name, self.chat.is_broadcast)
 
         # Join room group
         await self.channel_layer.group_add(
             self.chat_group_id,
             self.channel_name
         )
-        await self.accept()
+        await self.accept(subprotocol=self.scope.get('auth_subprotocol'))
+        # No presence in broadcast channels: subscribers are not announced to each other.
+        if not self.chat.is_broadcast:
+            await self.join_presence()
 
     async def disconnect(self, close_code):
+        self.stop_outbound()
+        self.stop_batching()
+        if getattr(self, 'presence_joined', False):
+            await self.leave_presence()
         # Leave room group
-        await self.channel_layer.group_discard(
-            self.chat_group_id,
-            self.channel_name
-        )
+        if hasattr(self, 'chat_group_id'):
+            await self.channel_layer.group_discard(
+                self.chat_group_id,
+                self.channel_name
+            )
 
     async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json['message']
-        await self.channel_layer.group_send(
-            self.chat_group_id,
-            {
-                'type': 'chat_message',
-                'message': message ,
-            }
-        )
-    async def chat_message(self, event):
-        message = event['message']
+        try:
+            text_data_json = json.loads(text_data)
+            kind = text_data_json.get('type', 'message')
+            message = text_data_json['message'] if kind == 'message' else None
+        except (ValueError, TypeError, KeyError, AttributeError):
+            await self.send_error("پیام نامعتبر است.")
+            return
+        if kind in ('heartbeat', 'typing'):
+            if self.presence_joined:
+                await (self.heartbeat() if kind == 'heartbeat' else self.typing())
+            return
+        if kind != 'message':
+            await self.send_error("پیام نامعتبر است.")
+            return
+        if await self.post_message(self.chat.pk, message, text_data_json.get('client_id')) and self.presence_joined:
+            await self.heartbeat()
+
+    @database_sync_to_async
+    def get_chat(self):
+        if self.user is None or not self.user.is_authenticated:
+            return None
+        return self.user.chats.filter(id=self.chat_id).first()
 
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({
-            'message': message ,
 
-        }, ensure_ascii=False))
\ No newline at end of file
+class UserConsumer(MessagingMixin, OutboundQueueMixin, FrameBatchingMixin, AsyncWebsocketConsumer):
+    """
+    One socket per user for every chat they are in. The connection joins
+    the user's own group, where chat events are fanned out to each member,
+    plus one shard group of every broadcast channel the user follows at
+    connect time. Events carry ``chat_id``, and outgoing messages name
+    their chat: ``{"chat_id": 1, "message": "...", "client_id": "..."}``.
+    """
+
+    async def connect(self):
+        self.setup_batching()
+        self.setup_messaging()
+        self.compact = query_flag(self.scope, 'compact')
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close()
+            return
+        self.setup_outbound()
+        self.user_group_id = user_group_name(self.user.pk)
+        self.groups_joined = [self.user_group_id]
+        self.groups_joined += [
+            chat_group_for(chat_id, self.channel_name, broadcast=True) for chat_id in await self.get_broadcast_chat_ids()
+        ]
+        await asyncio.gather(*(self.channel_layer.group_add(group, self.channel_name) for group in self.groups_joined))
+        await self.accept(subprotocol=self.scope.get('auth_subprotocol'))
+
+    async def disconnect(self, close_code):
+        self.stop_outbound()
+        self.stop_batching()
+        groups = getattr(self, 'groups_joined', [])
+        await asyncio.gather(*(self.channel_layer.group_discard(group, self.channel_name) for group in groups))
+
+    @database_sync_to_async
+    def get_broadcast_chat_ids(self):
+        return get_user_broadcasts(self.user.pk)
+
+    async def receive(self, text_data):
+        try:
+            text_data_json = json.loads(text_data)
+            chat_id = int(text_data_json['chat_id'])
+            message = text_data_json['message']
+        except (ValueError, TypeError, KeyError):
+            await self.send_error("پیام نامعتبر است.")
+            return
+        await self.post_message(chat_id, message, text_data_json.get('client_id'))
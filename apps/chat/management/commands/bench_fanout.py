@@ -0,0 +1,86 @@
+import json
+import time
+import uuid
+from copy import deepcopy
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from apps.chat.services import encoding
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare CPU time per broadcast when every subscriber re-encodes the event "
+        "against encoding it once on the sender and forwarding the text. Both paths "
+        "pay the layer's per-receiver copy and a stub socket send."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10, 100, 1000, 2000],
+                            help="Group sizes (subscribers per broadcast).")
+        parser.add_argument('--broadcasts', type=int, default=200, help="Broadcasts per group size.")
+        parser.add_argument('--layer', choices=['memory', 'redis'], default='memory',
+                            help="How a message crosses the layer: InMemoryChannelLayer's deepcopy per "
+                                 "channel, or channels_redis' msgpack encode per send and decode per receiver.")
+
+    def handle(self, *args, **options):
+        event = {
+            "v": 1,
+            "type": "message",
+            "id": 123456,
+            "uid": str(uuid.uuid4()),
+            "chat_id": 42,
+            "sender_id": str(uuid.uuid4()),
+            "body": "سلام، این یک پیام آزمایشی است. " * 4,
+            "timestamp": timezone.now().isoformat(),
+        }
+        transport = self.transport(options['layer'])
+        encoder = 'orjson' if encoding.orjson is not None else 'json'
+        self.stdout.write(f"encoder for pre-encoded path: {encoder}, layer: {options['layer']}")
+        self.stdout.write(f"{'subscribers':>12} {'per-subscriber us':>18} {'pre-encoded us':>15} {'speedup':>8}")
+
+        for size in options['sizes']:
+            per_subscriber = self.measure(options['broadcasts'], lambda: self.per_subscriber(event, size, transport))
+            pre_encoded = self.measure(options['broadcasts'], lambda: self.pre_encoded(event, size, transport))
+            self.stdout.write(
+                f"{size:>12} {per_subscriber:>18.1f} {pre_encoded:>15.1f} {per_subscriber / pre_encoded:>7.1f}x"
+            )
+
+    def transport(self, layer):
+        # Yields the copy of ``message`` each of ``size`` receiving consumers gets.
+        if layer == 'memory':
+            def deliver(message, size):
+                for _ in range(size):
+                    yield deepcopy(message)
+            return deliver
+        try:
+            import msgpack
+        except ImportError:
+            raise CommandError("--layer redis needs msgpack, which channels_redis depends on.")
+
+        def deliver(message, size):
+            packed = msgpack.packb(message, use_bin_type=True)
+            for _ in range(size):
+                yield msgpack.unpackb(packed, raw=False)
+        return deliver
+
+    def measure(self, broadcasts, broadcast):
+        started = time.process_time()
+        for _ in range(broadcasts):
+            broadcast()
+        return (time.process_time() - started) / broadcasts * 1_000_000
+
+    def send(self, text_data):
+        # Stands in for AsyncWebsocketConsumer.send: the text is handed over as-is.
+        pass
+
+    def per_subscriber(self, event, size, transport):
+        # Previous behaviour: the dict crosses the layer and each consumer calls json.dumps.
+        for message in transport({'type': 'chat_message', 'event': event}, size):
+            self.send(text_data=json.dumps(message['event'], ensure_ascii=False))
+
+    def pre_encoded(self, event, size, transport):
+        # Same path minus the encode: the sender's text crosses the layer and is forwarded.
+        for message in transport({'type': 'chat_message', 'frame': encoding.dumps(event)}, size):
+            self.send(text_data=message['frame'])
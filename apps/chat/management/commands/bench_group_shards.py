@@ -0,0 +1,127 @@
+import gc
+import time
+import zlib
+import asyncio
+
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.management.base import BaseCommand
+
+from apps.chat.services.fanout import chat_group_name, send_to_groups, shard_for
+
+BENCH_CHAT_ID = 0
+
+
+class RedisStandInLayer(InMemoryChannelLayer):
+    """
+    In-memory layer that charges the round trips channels_redis would make.
+    A cost model, not a measurement: the prices are --command-us and
+    --member-us, so its numbers show how sharding scales under those
+    assumptions and nothing about a real Redis.
+
+    Every host serves one command at a time. A group's member set lives on
+    the host its name hashes to, so reading it is one command priced per
+    member; delivery is then one command per host holding recipients,
+    priced per recipient, as with channels_redis' per-connection Lua push.
+    """
+
+    def __init__(self, hosts, command_us, member_us):
+        super().__init__(capacity=100, expiry=3600)
+        self.host_locks = [asyncio.Lock() for _ in range(hosts)]
+        self.command_us = command_us
+        self.member_us = member_us
+
+    def _clean_expired(self):
+        # Nothing expires during a run, and the full scan on every receive would dominate it.
+        pass
+
+    def host(self, name):
+        return zlib.crc32(name.encode()) % len(self.host_locks)
+
+    async def execute(self, host, members):
+        async with self.host_locks[host]:
+            await asyncio.sleep((self.command_us + members * self.member_us) / 1_000_000)
+
+    async def group_send(self, group, message):
+        channels = list(self.groups.get(group, ()))
+        await self.execute(self.host(group), len(channels))
+        by_host = {}
+        for channel in channels:
+            by_host.setdefault(self.host(channel), []).append(channel)
+        await asyncio.gather(*(self.deliver(host, recipients, message) for host, recipients in by_host.items()))
+
+    async def deliver(self, host, channels, message):
+        await self.execute(host, len(channels))
+        # channels_redis serializes a message once per push, not once per channel like send() copies.
+        expires = time.time() + self.expiry
+        for channel in channels:
+            self.channels.setdefault(channel, asyncio.Queue()).put_nowait((expires, message))
+
+
+class Command(BaseCommand):
+    help = (
+        "Fan one event out to a chat with many subscribed sockets and compare delivery "
+        "latency for different numbers of group shards. By default this runs a cost model "
+        "(an in-memory layer charging assumed per-command and per-member Redis costs), not "
+        "a measurement; use --configured to time the configured CHANNEL_LAYERS, e.g. a real Redis."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=10_000)
+        parser.add_argument('--shards', nargs='+', type=int, default=[1, 4, 16, 64])
+        parser.add_argument('--sends', type=int, default=5, help="Events timed per shard count.")
+        parser.add_argument('--configured', action='store_true',
+                            help="Measure the configured channel layer (e.g. channels_redis on a local Redis).")
+        parser.add_argument('--hosts', type=int, default=4, help="Stand-in: Redis hosts.")
+        parser.add_argument('--command-us', type=float, default=100, help="Stand-in: cost of one command.")
+        parser.add_argument('--member-us', type=float, default=3, help="Stand-in: cost per member read or pushed.")
+
+    def handle(self, *args, **options):
+        if not options['configured']:
+            self.stdout.write(
+                f"Modelled, not measured: {options['hosts']} hosts at {options['command_us']} us per command "
+                f"and {options['member_us']} us per member. Pass --configured to time a real channel layer."
+            )
+        self.stdout.write(f"{'shards':>7} {'send ms':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for shards in options['shards']:
+            send, p50, p99, last = asyncio.run(self.run(shards, options))
+            self.stdout.write(f"{shards:>7} {send:>9.1f} {p50:>9.1f} {p99:>9.1f} {last:>9.1f}")
+
+    def make_layer(self, options):
+        if options['configured']:
+            return get_channel_layer()
+        return RedisStandInLayer(options['hosts'], options['command_us'], options['member_us'])
+
+    async def run(self, shards, options):
+        layer = self.make_layer(options)
+        channels = [await layer.new_channel() for _ in range(options['subscribers'])]
+        groups = [chat_group_name(BENCH_CHAT_ID, shard) for shard in range(shards)]
+        for channel in channels:
+            await layer.group_add(chat_group_name(BENCH_CHAT_ID, shard_for(channel, shards)), channel)
+
+        event = {'type': 'chat_message', 'frame': 'x' * 300}
+        sends, latencies = [], []
+        for _ in range(options['sends']):
+            clock = {}
+            receivers = [asyncio.create_task(self.receive(layer, channel, clock)) for channel in channels]
+            await asyncio.sleep(0)
+            # A collection pass over 10k fresh tasks would land in one run at random.
+            gc.disable()
+            clock['started'] = time.perf_counter()
+            await send_to_groups(layer, groups, event)
+            sends.append(time.perf_counter() - clock['started'])
+            latencies += await asyncio.gather(*receivers)
+            gc.enable()
+
+        for channel in channels:
+            await layer.group_discard(chat_group_name(BENCH_CHAT_ID, shard_for(channel, shards)), channel)
+        latencies.sort()
+        return (
+            sum(sends) / len(sends) * 1000,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000,
+            latencies[-1] * 1000,
+        )
+
+    async def receive(self, layer, channel, clock):
+        await layer.receive(channel)
+        return time.perf_counter() - clock['started']
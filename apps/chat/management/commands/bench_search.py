@@ -0,0 +1,72 @@
+import time
+import random
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand
+
+from apps.account.models import Profile
+from apps.chat.models import Chat, Message
+from apps.chat.services.search import MessageSearch
+
+VOCABULARY = [
+    'سلام', 'خداحافظ', 'جلسه', 'فردا', 'امروز', 'پروژه', 'گزارش', 'قرارداد', 'مشتری', 'تحویل',
+    'hello', 'meeting', 'deploy', 'invoice', 'release', 'server', 'report', 'coffee', 'weekend', 'budget',
+]
+# A long Zipf-like tail on top of the common words, so searched terms have realistic selectivity.
+RARE_WORDS = [f'term{i}' for i in range(10000)]
+WORDS = VOCABULARY + RARE_WORDS
+CUMULATIVE_WEIGHTS = list(accumulate(1 / rank for rank in range(1, len(WORDS) + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill a throwaway chat with a synthetic corpus and compare indexed full-text "
+        "search against an icontains scan. Run against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1_000_000, help="Size of the synthetic corpus.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--queries', type=int, default=20, help="Searches timed per method.")
+        parser.add_argument('--keep', action='store_true', help="Keep the corpus for later runs.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        user, _ = Profile.objects.get_or_create(username='bench_search')
+        chat = Chat.objects.create(name='bench_search', create_by=user, is_group=True)
+        chat.participants.add(user)
+
+        started = time.perf_counter()
+        self.fill(chat, user, options['messages'], options['batch_size'], rng)
+        self.stdout.write(f"inserted and indexed {options['messages']} messages in {time.perf_counter() - started:.1f}s")
+
+        terms = [rng.choice(RARE_WORDS[100:2000]) for _ in range(options['queries'])]
+        indexed = self.measure(terms, lambda term: MessageSearch(user, term)[:20])
+        scanned = self.measure(
+            terms, lambda term: list(Message.objects.filter(chat__participants=user, message__icontains=term)
+                                     .order_by('-id')[:20])
+        )
+        self.stdout.write(f"{'method':>10} {'avg ms':>10}")
+        self.stdout.write(f"{'fts':>10} {indexed:>10.1f}")
+        self.stdout.write(f"{'icontains':>10} {scanned:>10.1f}")
+
+        if not options['keep']:
+            chat.delete()
+
+    def fill(self, chat, user, total, batch_size, rng):
+        for start in range(0, total, batch_size):
+            messages = [
+                Message(chat=chat, sender=user, message=self.sentence(rng))
+                for _ in range(min(batch_size, total - start))
+            ]
+            # Triggers on chat_message index the rows as they are inserted.
+            Message.objects.bulk_create(messages)
+
+    def sentence(self, rng):
+        return ' '.join(rng.choices(WORDS, cum_weights=CUMULATIVE_WEIGHTS, k=rng.randint(3, 15)))
+
+    def measure(self, terms, search):
+        started = time.perf_counter()
+        for term in terms:
+            search(term)
+        return (time.perf_counter() - started) / len(terms) * 1000
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.chat.models import Chat
+from apps.chat.services.messages import rebuild_chat_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized last_message, last_message_at, message_count and last_seq columns of Chat."
+
+    def add_arguments(self, parser):
+        parser.add_argument('chat_ids', nargs='*', type=int, help="Only rebuild these chats.")
+
+    def handle(self, *args, **options):
+        chats = Chat.objects.all()
+        if options['chat_ids']:
+            chats = chats.filter(id__in=options['chat_ids'])
+        updated = rebuild_chat_stats(chats)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {updated} chats."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.chat.services.search import SearchNotSupported, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text message search index from the chat_message table."
+
+    def handle(self, *args, **options):
+        try:
+            rebuild_index()
+        except SearchNotSupported as exc:
+            raise CommandError(f"Full-text search is not supported on {exc}.")
+        self.stdout.write(self.style.SUCCESS("Rebuilt the message search index."))
@@ -0,0 +1,31 @@
+import asyncio
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.chat.services.outbox import OutboxRelay
+
+
+class Command(BaseCommand):
+    help = (
+        "Send stored outbox events to the channel layer (CHAT_FANOUT_MODE = \"outbox\"). "
+        "Runs until interrupted; run one per deployment."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.CHAT_OUTBOX_BATCH_SIZE)
+        parser.add_argument('--poll-interval-ms', type=int, default=settings.CHAT_OUTBOX_POLL_INTERVAL_MS)
+        parser.add_argument('--once', action='store_true', help="Drain what is pending, then exit.")
+
+    def handle(self, *args, **options):
+        relay = OutboxRelay(get_channel_layer(), options['batch_size'], options['poll_interval_ms'] / 1000)
+        try:
+            asyncio.run(relay.run(once=options['once']))
+        except KeyboardInterrupt:
+            pass
+        stats = relay.stats
+        self.stdout.write(
+            f"relayed {stats['relayed']} events in {stats['batches']} batches, "
+            f"{stats['failed']} failed sends, max lag {stats['max_lag_ms']:.0f} ms"
+        )
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_chat_stats(apps, schema_editor):
+    Chat = apps.get_model('chat', 'Chat')
+    Message = apps.get_model('chat', 'Message')
+    last = Message.objects.filter(chat=OuterRef('pk')).order_by('-timestamp', '-id')
+    count = Message.objects.filter(chat=OuterRef('pk')).values('chat').annotate(total=Count('id')).values('total')
+    Chat.objects.update(
+        last_message=Subquery(last.values('id')[:1]),
+        last_message_at=Coalesce(Subquery(last.values('timestamp')[:1]), F('created')),
+        message_count=Coalesce(Subquery(count), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_chat_timestamp_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.message'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='last_message_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_chat_stats, migrations.RunPython.noop),
+    ]
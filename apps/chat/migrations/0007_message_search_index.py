@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        # External-content FTS5 table: the text lives only in chat_message, FTS5 keeps the index.
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE chat_message_fts USING fts5("
+            "message, content='chat_message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute("INSERT INTO chat_message_fts (chat_message_fts) VALUES ('rebuild')")
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX message_body_search_idx ON chat_message USING GIN (to_tsvector('simple', message))"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS chat_message_fts")
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS message_body_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_sync_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
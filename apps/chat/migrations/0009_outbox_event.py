@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:35
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_broadcast_chat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('groups', models.JSONField()),
+                ('event', models.JSONField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'رویداد صف خروجی',
+                'verbose_name_plural': 'رویدادهای صف خروجی',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:52
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def split_message_count(apps, schema_editor):
+    # message_count held the newest seq until now; move that to last_seq and count the rows again.
+    Chat = apps.get_model('chat', 'Chat')
+    Message = apps.get_model('chat', 'Message')
+    count = Message.objects.filter(chat=OuterRef('pk')).order_by().values('chat').annotate(total=Count('id')).values('total')
+    Chat.objects.update(last_seq=F('message_count'))
+    Chat.objects.update(message_count=Coalesce(Subquery(count), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(split_message_count, migrations.RunPython.noop),
+    ]
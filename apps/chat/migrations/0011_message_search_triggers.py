@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# Keep the external-content FTS5 table in step with chat_message whatever
+# writes the rows: store_message, bulk inserts, the admin, cascades, raw SQL.
+TRIGGERS = {
+    'chat_message_fts_ai': (
+        "AFTER INSERT ON chat_message BEGIN "
+        "INSERT INTO chat_message_fts (rowid, message) VALUES (new.id, new.message); "
+        "END"
+    ),
+    'chat_message_fts_ad': (
+        "AFTER DELETE ON chat_message BEGIN "
+        "INSERT INTO chat_message_fts (chat_message_fts, rowid, message) VALUES ('delete', old.id, old.message); "
+        "END"
+    ),
+    'chat_message_fts_au': (
+        "AFTER UPDATE OF message ON chat_message BEGIN "
+        "INSERT INTO chat_message_fts (chat_message_fts, rowid, message) VALUES ('delete', old.id, old.message); "
+        "INSERT INTO chat_message_fts (rowid, message) VALUES (new.id, new.message); "
+        "END"
+    ),
+}
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name, body in TRIGGERS.items():
+        schema_editor.execute(f"CREATE TRIGGER {name} {body}")
+    # Edits and deletes made before the triggers existed never reached the index.
+    schema_editor.execute("INSERT INTO chat_message_fts (chat_message_fts) VALUES ('rebuild')")
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_chat_last_seq'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_message_search_triggers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncevent',
+            name='seq',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,8 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
+
 from apps.account.models import Profile
 
 
@@ -8,6 +12,18 @@ class Chat(models.Model) :
     participants = models.ManyToManyField(Profile, related_name="chats")
     created = models.DateTimeField(auto_now_add=True)
     name = models.CharField(max_length=255, blank=True, null=True)
+    # Broadcast channels: only admins post, subscribers read the shared timeline
+    # and are never enumerated on the message path.
+    is_broadcast = models.BooleanField(default=False)
+    admins = models.ManyToManyField(Profile, related_name="administered_chats", blank=True)
+
+    # Denormalized from Message, kept current by apps.chat.services.messages.store_message.
+    # last_message_at holds the creation time until the first message arrives.
+    last_message_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_message = models.ForeignKey("Message", on_delete=models.SET_NULL, related_name="+", null=True, blank=True)
+    message_count = models.PositiveIntegerField(default=0)
+    # The chat's message sequence: the seq of the newest message. Never moves back, even when messages are deleted.
+    last_seq = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f'Chat  {self.name} '
@@ -16,10 +32,15 @@ class Chat(models.Model) :
         verbose_name_plural = "چت ها"
 
 class Message(models.Model):
+    # uid is known before the row is written, so write-behind ingestion can ack and fan out immediately.
+    uid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="messages", null=True)
     sender = models.ForeignKey(Profile, on_delete=models.CASCADE)
     message = models.TextField(null=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Position of the message within its chat (1, 2, 3, ...); unread counts are differences of seq.
+    seq = models.PositiveIntegerField(null=True, blank=True)
+    # A default rather than auto_now_add: bulk_create would otherwise restamp queued messages at flush time.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return f'{self.sender.username}: {self.message}'
@@ -27,3 +48,72 @@ class Message(models.Model):
     class Meta:
         verbose_name = "پیام"
         verbose_name_plural = "پیام ها"
+        indexes = [
+            models.Index(fields=['chat', 'timestamp', 'id'], name='message_chat_timestamp_id_idx'),
+            models.Index(fields=['chat', 'id'], name='message_chat_id_idx'),
+        ]
+
+class ReadState(models.Model):
+    user = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="read_states")
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name="read_states")
+    last_read_message = models.ForeignKey(Message, on_delete=models.SET_NULL, related_name="+", null=True, blank=True)
+    # Unread count is chat.last_seq - last_read_seq.
+    last_read_seq = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user.username} read {self.chat_id} up to {self.last_read_seq}'
+
+    class Meta:
+        verbose_name = "وضعیت خواندن"
+        verbose_name_plural = "وضعیت های خواندن"
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'chat'], name='read_state_user_chat_unique'),
+        ]
+
+class SyncEvent(models.Model):
+    JOINED = 'joined'
+    LEFT = 'left'
+    FAVORITED = 'favorited'
+    UNFAVORITED = 'unfavorited'
+    KIND_CHOICES = [
+        (JOINED, 'joined'),
+        (LEFT, 'left'),
+        (FAVORITED, 'favorited'),
+        (UNFAVORITED, 'unfavorited'),
+    ]
+
+    # Per-user change log behind the sync token; the id is the watermark.
+    user = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="sync_events")
+    # Plain id rather than a ForeignKey so the event survives the chat being deleted.
+    chat_id = models.BigIntegerField()
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    # Joins only: the chat's last_seq at the time, where syncing the chat's messages starts.
+    seq = models.PositiveIntegerField(null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.user.username} {self.kind} {self.chat_id}'
+
+    class Meta:
+        verbose_name = "رویداد همگام سازی"
+        verbose_name_plural = "رویدادهای همگام سازی"
+        indexes = [
+            models.Index(fields=['user', 'id'], name='sync_event_user_id_idx'),
+        ]
+
+class OutboxEvent(models.Model):
+    # Channel-layer events written in the same transaction as the change they
+    # announce; the relay_outbox command sends them and deletes the rows.
+    uid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    groups = models.JSONField()
+    event = models.JSONField()
+    attempts = models.PositiveIntegerField(default=0)
+    created = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.event.get("type")} -> {len(self.groups)} groups'
+
+    class Meta:
+        verbose_name = "رویداد صف خروجی"
+        verbose_name_plural = "رویدادهای صف خروجی"
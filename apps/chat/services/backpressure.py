@@ -0,0 +1,87 @@
+from collections import deque
+
+from apps.chat.services.encoding import dumps
+from apps.chat.services.fanout import EVENT_VERSION
+
+DROP_OLDEST = 'drop_oldest'
+RESYNC = 'resync'
+DISCONNECT = 'disconnect'
+
+# Tells the client it missed events and should catch up through the sync endpoint.
+RESYNC_FRAME = dumps({'v': EVENT_VERSION, 'type': 'resync'})
+
+# Process-wide counters across every connection on this worker.
+stats = {
+    'connections': 0,
+    'queued': 0,
+    'max_depth': 0,
+    'dropped': 0,
+    'resyncs': 0,
+    'disconnects': 0,
+}
+
+
+def outbound_metrics():
+    return dict(stats)
+
+
+class SlowConsumer(Exception):
+    pass
+
+
+class OutboundQueue:
+    """
+    Bounded buffer of encoded frames waiting to be written to one socket.
+
+    When a frame arrives at a full queue the policy decides: DROP_OLDEST
+    discards the oldest frame, RESYNC replaces everything queued with a
+    single resync marker, and DISCONNECT raises SlowConsumer so the caller
+    can close the connection.
+    """
+
+    def __init__(self, max_size, policy):
+        self.max_size = max_size
+        self.policy = policy
+        self.frames = deque()
+        self.dropped = 0
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def push(self, frame):
+        if len(self.frames) >= self.max_size:
+            self.overflow()
+        self.frames.append(frame)
+        stats['queued'] += 1
+        self.max_depth = max(self.max_depth, len(self.frames))
+        stats['max_depth'] = max(stats['max_depth'], len(self.frames))
+
+    def overflow(self):
+        if self.policy == DROP_OLDEST:
+            self.frames.popleft()
+            self.record_drops(1)
+        elif self.policy == RESYNC:
+            self.record_drops(len(self.frames))
+            stats['resyncs'] += 1
+            self.frames.clear()
+            self.frames.append(RESYNC_FRAME)
+            stats['queued'] += 1
+        else:
+            stats['disconnects'] += 1
+            self.record_drops(len(self.frames))
+            self.frames.clear()
+            raise SlowConsumer()
+
+    def pop(self):
+        stats['queued'] -= 1
+        return self.frames.popleft()
+
+    def record_drops(self, count):
+        self.dropped += count
+        stats['dropped'] += count
+        stats['queued'] -= count
+
+    def clear(self):
+        stats['queued'] -= len(self.frames)
+        self.frames.clear()
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.db import transaction
+from django.core.cache import cache
+
+from apps.chat.models import Chat, Message
+
+
+def chat_kind_key(chat_id):
+    return f'chat:{chat_id}:broadcast'
+
+
+def broadcast_chat_ids(chat_ids):
+    """
+    The broadcast chats among ``chat_ids``. The flag is cached per chat with no
+    timeout (post_save on Chat drops it), so the message path never has to
+    query the chat row to decide how to fan out.
+    """
+    chat_ids = {int(chat_id) for chat_id in chat_ids}
+    keys = {chat_kind_key(chat_id): chat_id for chat_id in chat_ids}
+    flags = {keys[key]: flag for key, flag in cache.get_many(keys).items()}
+    missing = chat_ids - flags.keys()
+    if missing:
+        fetched = dict(Chat.objects.filter(id__in=missing).values_list('id', 'is_broadcast'))
+        fetched = {chat_id: fetched.get(chat_id, False) for chat_id in missing}
+        cache.set_many({chat_kind_key(chat_id): flag for chat_id, flag in fetched.items()}, None)
+        flags.update(fetched)
+    return {chat_id for chat_id, flag in flags.items() if flag}
+
+
+def is_broadcast(chat_id):
+    return bool(broadcast_chat_ids([chat_id]))
+
+
+def invalidate_chat_kind(*chat_ids):
+    cache.delete_many([chat_kind_key(chat_id) for chat_id in chat_ids])
+
+
+def user_broadcasts_key(user_id):
+    return f'profile:{user_id}:broadcasts'
+
+
+def get_user_broadcasts(user_id):
+    key = user_broadcasts_key(user_id)
+    chat_ids = cache.get(key)
+    if chat_ids is None:
+        chat_ids = set(
+            Chat.participants.through.objects.filter(profile_id=user_id, chat__is_broadcast=True)
+            .values_list('chat_id', flat=True)
+        )
+        cache.set(key, chat_ids, settings.CHAT_ACL_CACHE_TIMEOUT)
+    return chat_ids
+
+
+def invalidate_user_broadcasts(user_ids):
+    cache.delete_many([user_broadcasts_key(user_id) for user_id in set(user_ids)])
+
+
+def timeline_key(chat_id):
+    return f'chat:{chat_id}:timeline'
+
+
+def recent_timeline(chat_id):
+    """
+    The newest CHAT_BROADCAST_TIMELINE_SIZE + 1 messages of a broadcast chat,
+    newest first. Every subscriber opening the channel reads this one cached
+    list; the extra row tells whether older history exists.
+    """
+    key = timeline_key(chat_id)
+    messages = cache.get(key)
+    if messages is None:
+        messages = refresh_timeline(chat_id)
+    return messages
+
+
+def refresh_timeline(chat_id):
+    size = settings.CHAT_BROADCAST_TIMELINE_SIZE + 1
+    messages = list(Message.objects.filter(chat_id=chat_id).order_by('-timestamp', '-id')[:size])
+    cache.set(timeline_key(chat_id), messages, settings.CHAT_BROADCAST_TIMELINE_TIMEOUT)
+    return messages
+
+
+def timeline_changed(chat_id):
+    # Dropped at once so this transaction's own reads cannot see a stale window,
+    # then rebuilt by the writer after commit rather than by the first of many readers.
+    cache.delete(timeline_key(chat_id))
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: refresh_timeline(chat_id))
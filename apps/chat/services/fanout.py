@@ -0,0 +1,125 @@
+import zlib
+import asyncio
+from functools import lru_cache
+
+from django.conf import settings
+
+from apps.chat.services.encoding import dumps, loads
+from apps.chat.services.broadcast import is_broadcast
+from apps.chat.services.permissions import get_chat_members
+
+EVENT_VERSION = 1
+
+# Short keys for bandwidth-constrained clients (?compact=1).
+COMPACT_KEYS = {
+    'v': 'v',
+    'type': 'e',
+    'id': 'i',
+    'uid': 'u',
+    'chat_id': 'c',
+    'sender_id': 's',
+    'body': 'b',
+    'timestamp': 't',
+    'seq': 'n',
+    'user_id': 'w',
+    'last_read_id': 'r',
+    'last_read_seq': 'q',
+    'online': 'o',
+    'user_ids': 'ws',
+}
+
+
+def chat_group_name(chat_id, shard):
+    return f'chat_{chat_id}_{shard}'
+
+
+def user_group_name(user_id):
+    return f'user_{user_id}'
+
+
+def chat_shard_count(broadcast):
+    return settings.CHAT_BROADCAST_SHARDS if broadcast else settings.CHAT_GROUP_SHARDS
+
+
+def chat_socket_groups(chat_id, broadcast=False):
+    """
+    The groups holding a chat's sockets. Membership is split over shard
+    groups so no single channel-layer key (a Redis sorted set with
+    channels_redis, which also picks the host per group) holds every
+    connection of a busy chat; senders address all shards at once.
+    """
+    return [chat_group_name(chat_id, shard) for shard in range(chat_shard_count(broadcast))]
+
+
+def shard_for(channel_name, shards):
+    # A stable hash, so every worker puts a given connection in the same shard.
+    return zlib.crc32(channel_name.encode()) % shards
+
+
+def chat_group_for(chat_id, channel_name, broadcast=False):
+    return chat_group_name(chat_id, shard_for(channel_name, chat_shard_count(broadcast)))
+
+
+def chat_groups(chat_id):
+    # Broadcast subscribers are never enumerated: their sockets sit in the channel's shard groups.
+    if is_broadcast(chat_id):
+        return chat_socket_groups(chat_id, broadcast=True)
+    # The chat's sockets plus every member's group for ws/user/ sockets.
+    return [*chat_socket_groups(chat_id), *(user_group_name(user_id) for user_id in get_chat_members(chat_id))]
+
+
+def read_groups(chat_id, user_id):
+    # In a broadcast channel only the reader's own devices care about their cursor.
+    if is_broadcast(chat_id):
+        return [user_group_name(user_id)]
+    return chat_groups(chat_id)
+
+
+async def send_to_groups(channel_layer, groups, event):
+    # Concurrently, so shards on different hosts or pooled connections are written in parallel.
+    await asyncio.gather(*(channel_layer.group_send(group, event) for group in groups))
+
+
+def compact(payload):
+    return {COMPACT_KEYS.get(key, key): value for key, value in payload.items()}
+
+
+@lru_cache(maxsize=1024)
+def compact_frame(frame):
+    # Derived on the receiving worker, and only for ?compact=1 sockets; all of
+    # them on one worker share a single re-encoding of each event.
+    return dumps(compact(loads(frame)))
+
+
+def frame_event(event_type, data, handler='chat_message'):
+    # Encoded once here; every subscribed consumer forwards the text as-is.
+    payload = {'v': EVENT_VERSION, 'type': event_type, **data}
+    return {"type": handler, "frame": dumps(payload)}
+
+
+def message_event(data):
+    # data is MessageEventSerializer output.
+    return frame_event('message', data)
+
+
+def read_event(state):
+    return frame_event('read', {
+        'chat_id': state.chat_id,
+        'user_id': str(state.user_id),
+        'last_read_id': state.last_read_message_id,
+        'last_read_seq': state.last_read_seq,
+    })
+
+
+def presence_event(chat_id, user_id, online):
+    # Delivered through chat_presence, which only ?presence=1 connections forward.
+    event = frame_event('presence', {'chat_id': chat_id, 'user_id': str(user_id), 'online': online}, 'chat_presence')
+    event['user_ids'] = [str(user_id)]
+    return event
+
+
+def typing_event(chat_id, user_ids):
+    user_ids = [str(user_id) for user_id in user_ids]
+    event = frame_event('typing', {'chat_id': chat_id, 'user_ids': user_ids}, 'chat_presence')
+    event['user_ids'] = user_ids
+    return event
@@ -0,0 +1,198 @@
+import time
+import atexit
+import asyncio
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import DataError, IntegrityError
+
+from channels.db import database_sync_to_async
+
+from apps.chat.models import Message
+from apps.chat.services.messages import store_message, store_messages
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND = 'write_behind'
+# Errors that say the row itself is unacceptable; retrying cannot help. Anything
+# else (a locked table, a lost connection) is retried.
+PERMANENT_ERRORS = (IntegrityError, DataError)
+MAX_RETRY_DELAY = 5
+
+
+class IngestionQueueFull(Exception):
+    pass
+
+
+class MessageIngestor:
+    """
+    Write-behind buffer for new messages.
+
+    Callers get the unsaved Message back at once (its uid and timestamp are
+    already final) and a background asyncio task on its own thread writes
+    the queue with bulk_create every ``flush_interval`` seconds, or sooner
+    once ``batch_size`` messages are waiting.
+
+    These messages were already acknowledged, so a failed write puts them
+    back at the head of the queue and retries with exponential backoff.
+    Only messages the database rejects outright are dropped (``dropped``).
+    """
+
+    def __init__(self, batch_size, flush_interval, max_queue):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.wakeup = None
+        self.stopping = False
+        self.retry_delay = 0
+        self.stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'requeued': 0,
+            'dropped': 0,
+            'batches': 0,
+            'max_queue_depth': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        self.wakeup = asyncio.Event()
+        self.thread = threading.Thread(
+            target=self.loop.run_until_complete, args=(self.run(),), name='message-ingestor', daemon=True,
+        )
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, message):
+        with self.lock:
+            if self.stopping or len(self.pending) >= self.max_queue:
+                raise IngestionQueueFull()
+            self.pending.append(message)
+            depth = len(self.pending)
+            self.stats['enqueued'] += 1
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], depth)
+        if depth >= self.batch_size:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        return message
+
+    async def run(self):
+        flush = database_sync_to_async(self.flush, thread_sensitive=False)
+        while True:
+            if self.retry_delay:
+                await asyncio.sleep(self.retry_delay)
+            else:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self.wakeup.clear()
+            await flush()
+            if self.stopping and not self.pending:
+                return
+
+    def take_batch(self):
+        with self.lock:
+            return [self.pending.popleft() for _ in range(min(len(self.pending), self.batch_size))]
+
+    def requeue(self, messages):
+        with self.lock:
+            self.pending.extendleft(reversed(messages))
+            self.stats['requeued'] += len(messages)
+
+    def flush(self):
+        while True:
+            batch = self.take_batch()
+            if not batch:
+                return
+            started = time.perf_counter()
+            try:
+                store_messages(batch)
+                flushed, dropped, retry = len(batch), 0, []
+            except PERMANENT_ERRORS:
+                logger.exception("Bulk insert of %d queued messages failed, retrying one by one", len(batch))
+                flushed, dropped, retry = self.flush_one_by_one(batch)
+            except Exception:
+                logger.exception("Bulk insert of %d queued messages failed, will retry", len(batch))
+                flushed, dropped, retry = 0, 0, batch
+            elapsed = (time.perf_counter() - started) * 1000
+            with self.lock:
+                self.stats['flushed'] += flushed
+                self.stats['dropped'] += dropped
+                self.stats['batches'] += 1
+                self.stats['last_flush_ms'] = elapsed
+                self.stats['max_flush_ms'] = max(self.stats['max_flush_ms'], elapsed)
+                self.stats['total_flush_ms'] += elapsed
+            if retry:
+                self.requeue(retry)
+                self.retry_delay = min(max(self.retry_delay * 2, self.flush_interval), MAX_RETRY_DELAY)
+                return
+            self.retry_delay = 0
+
+    def flush_one_by_one(self, batch):
+        # Finds the rows the database rejects; the first transient failure sends the rest back to the queue.
+        flushed = dropped = 0
+        for position, message in enumerate(batch):
+            try:
+                store_messages([message])
+                flushed += 1
+            except PERMANENT_ERRORS:
+                logger.exception("Dropping queued message %s", message.uid)
+                dropped += 1
+            except Exception:
+                logger.exception("Storing queued message %s failed, will retry", message.uid)
+                return flushed, dropped, batch[position:]
+        return flushed, dropped, []
+
+    def stop(self, timeout=10):
+        # Flush-on-shutdown: refuse new work, drain what is queued, then let the loop exit.
+        if self.thread is None or self.stopping:
+            return
+        self.stopping = True
+        self.loop.call_soon_threadsafe(self.wakeup.set)
+        self.thread.join(timeout)
+
+    def metrics(self):
+        with self.lock:
+            metrics = dict(self.stats, queue_depth=len(self.pending))
+        batches = metrics['batches']
+        metrics['avg_flush_ms'] = metrics['total_flush_ms'] / batches if batches else 0.0
+        return metrics
+
+
+_ingestor = None
+_ingestor_lock = threading.Lock()
+
+
+def get_ingestor():
+    global _ingestor
+    with _ingestor_lock:
+        if _ingestor is None:
+            _ingestor = MessageIngestor(
+                batch_size=settings.CHAT_INGESTION_BATCH_SIZE,
+                flush_interval=settings.CHAT_INGESTION_FLUSH_INTERVAL_MS / 1000,
+                max_queue=settings.CHAT_INGESTION_QUEUE_SIZE,
+            )
+            _ingestor.start()
+        return _ingestor
+
+
+def ingest_message(chat_id, sender, body):
+    if settings.CHAT_INGESTION_MODE != WRITE_BEHIND:
+        return store_message(chat_id, sender, body)
+    message = Message(chat_id=chat_id, sender=sender, message=body)
+    try:
+        return get_ingestor().submit(message)
+    except IngestionQueueFull:
+        # Degrade to a synchronous write rather than refusing the message.
+        return store_message(chat_id, sender, body)
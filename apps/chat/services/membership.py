@@ -0,0 +1,49 @@
+from django.db import router, transaction
+from django.db.models.signals import m2m_changed
+
+from apps.account.models import Profile
+from apps.chat.models import Chat
+
+ADDED = 'added'
+ALREADY_MEMBER = 'already_member'
+NOT_FOUND = 'not_found'
+
+
+class NotMember(Exception):
+    pass
+
+
+def add_members(chat, user_ids, added_by=None):
+    """
+    Add ``user_ids`` to ``chat`` set-wise and return ``[{'id', 'status'}]`` in
+    request order. Costs one query to resolve the ids, one for current
+    membership and one bulk INSERT, whatever the number of ids.
+
+    With ``added_by`` the caller must already be a member (NotMember otherwise);
+    that check rides on the membership query.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    Membership = Chat.participants.through
+    existing = set(Profile.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    lookup = existing | ({added_by} if added_by is not None else set())
+    members = set(Membership.objects.filter(chat_id=chat.pk, profile_id__in=lookup).values_list('profile_id', flat=True))
+    if added_by is not None and added_by not in members:
+        raise NotMember()
+
+    new = existing - members
+    if new:
+        # bulk_create skips m2m_changed, so send it ourselves: read states, sync
+        # events, ACL and version invalidation all hang off that signal.
+        signal = {'sender': Membership, 'instance': chat, 'reverse': False, 'model': Profile, 'pk_set': new,
+                  'using': router.db_for_write(Membership)}
+        with transaction.atomic():
+            m2m_changed.send(action='pre_add', **signal)
+            Membership.objects.bulk_create(
+                [Membership(chat_id=chat.pk, profile_id=user_id) for user_id in new], ignore_conflicts=True,
+            )
+            m2m_changed.send(action='post_add', **signal)
+
+    return [
+        {'id': user_id, 'status': ADDED if user_id in new else ALREADY_MEMBER if user_id in existing else NOT_FOUND}
+        for user_id in user_ids
+    ]
@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from apps.chat.models import Chat, Message
+from apps.chat.services.broadcast import is_broadcast, timeline_changed
+from apps.chat.services.fanout import chat_groups, message_event
+from apps.chat.services.outbox import enqueue, outbox_enabled
+from apps.chat.services.read_state import advance_own_cursors
+from apps.chat.api.serializers.chat import MessageEventSerializer
+from apps.chat.services.versions import bump_chat_members, bump_user_versions
+
+
+def allocate_seq(chat_id, count):
+    # Bumping last_seq takes the chat's row lock until commit, so concurrent
+    # senders get consecutive, non-overlapping sequence numbers.
+    Chat.objects.filter(pk=chat_id).update(last_seq=F('last_seq') + count, message_count=F('message_count') + count)
+    last_seq = Chat.objects.filter(pk=chat_id).values_list('last_seq', flat=True).get()
+    return last_seq - count + 1
+
+
+def set_last_message(chat_id, message):
+    Chat.objects.filter(pk=chat_id).update(last_message=message, last_message_at=message.timestamp)
+    bump_chat_members(chat_id)
+    if is_broadcast(chat_id):
+        timeline_changed(chat_id)
+
+
+def announce_messages(messages):
+    # Outbox mode: the message events commit or roll back with the messages.
+    if not outbox_enabled():
+        return
+    groups = {chat_id: chat_groups(chat_id) for chat_id in {message.chat_id for message in messages}}
+    enqueue([(groups[message.chat_id], message_event(MessageEventSerializer(message).data)) for message in messages])
+
+
+def store_message(chat_id, sender, body):
+    with transaction.atomic():
+        seq = allocate_seq(chat_id, 1)
+        message = Message.objects.create(chat_id=chat_id, sender=sender, message=body, seq=seq)
+        set_last_message(chat_id, message)
+        advance_own_cursors([message])
+        announce_messages([message])
+    return message
+
+
+def store_messages(messages):
+    # Batch counterpart of store_message: one INSERT, plus sequence and stats updates per chat.
+    by_chat = {}
+    for message in messages:
+        by_chat.setdefault(message.chat_id, []).append(message)
+    with transaction.atomic():
+        for chat_id, chat_messages in by_chat.items():
+            first_seq = allocate_seq(chat_id, len(chat_messages))
+            for offset, message in enumerate(chat_messages):
+                message.seq = first_seq + offset
+        Message.objects.bulk_create(messages)
+        advance_own_cursors(messages)
+        announce_messages(messages)
+        for chat_id, chat_messages in by_chat.items():
+            set_last_message(chat_id, chat_messages[-1])
+    return messages
+
+
+def renumber_messages(chat_id):
+    messages = list(Message.objects.filter(chat_id=chat_id).order_by('timestamp', 'id').only('id'))
+    for seq, message in enumerate(messages, start=1):
+        message.seq = seq
+    Message.objects.bulk_update(messages, ['seq'], batch_size=1000)
+
+
+def rebuild_chat_stats(chats=None):
+    chats = Chat.objects.all() if chats is None else chats
+    # Rows written around store_message (fixtures, raw inserts) have no seq yet.
+    unnumbered = Message.objects.filter(chat__in=chats, seq__isnull=True).values_list('chat_id', flat=True).distinct()
+    for chat_id in list(unnumbered):
+        renumber_messages(chat_id)
+
+    last = Message.objects.filter(chat=OuterRef('pk')).order_by(F('seq').desc(nulls_last=True), '-id')
+    totals = Message.objects.filter(chat=OuterRef('pk')).order_by().values('chat')
+    bump_user_versions(Chat.participants.through.objects.filter(chat__in=chats).values_list('profile_id', flat=True))
+    # last_seq only ever grows: a deleted newest message must not hand its seq out again.
+    return chats.update(
+        last_message=Subquery(last.values('id')[:1]),
+        last_message_at=Coalesce(Subquery(last.values('timestamp')[:1]), F('created')),
+        message_count=Coalesce(Subquery(totals.annotate(total=Count('id')).values('total')), 0),
+        last_seq=Greatest(F('last_seq'), Coalesce(Subquery(totals.annotate(top=Max('seq')).values('top')), 0)),
+    )
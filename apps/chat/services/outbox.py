@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from collections import deque
+
+from django.conf import settings
+from django.utils import timezone
+from django.db.models import F
+
+from channels.db import database_sync_to_async
+
+from apps.chat.models import OutboxEvent
+from apps.chat.services.fanout import send_to_groups
+
+logger = logging.getLogger(__name__)
+
+INLINE = 'inline'
+OUTBOX = 'outbox'
+# Seconds the relay waits after a failed send before trying the channel layer again.
+RETRY_DELAY = 1
+
+
+def outbox_enabled():
+    return settings.CHAT_FANOUT_MODE == OUTBOX
+
+
+def enqueue(entries):
+    """
+    Store ``(groups, event)`` pairs for the relay. Call inside the transaction
+    that makes the change, so an event exists exactly when its change does.
+    """
+    OutboxEvent.objects.bulk_create([OutboxEvent(groups=groups, event=event) for groups, event in entries])
+
+
+class RecentIds:
+    """The last ``size`` ids seen, for dropping at-least-once redeliveries."""
+
+    def __init__(self, size):
+        self.order = deque()
+        self.ids = set()
+        self.size = size
+
+    def seen(self, item):
+        if item in self.ids:
+            return True
+        self.ids.add(item)
+        self.order.append(item)
+        if len(self.order) > self.size:
+            self.ids.discard(self.order.popleft())
+        return False
+
+
+class OutboxRelay:
+    """
+    Sends OutboxEvent rows to the channel layer in id order, ``batch_size`` at
+    a time, and deletes each batch once it went out.
+
+    Delivery is at least once: a crash between sending and deleting sends
+    those rows again, so every event carries its row's uid as ``dedupe_id``
+    for consumers to drop repeats. A failed send stops the batch, keeping
+    per-chat order, and the rest waits for the next poll. One relay per
+    deployment; more only add duplicates.
+    """
+
+    def __init__(self, channel_layer, batch_size, poll_interval):
+        self.channel_layer = channel_layer
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stats = {'relayed': 0, 'failed': 0, 'batches': 0, 'max_lag_ms': 0.0}
+
+    async def run(self, once=False):
+        while True:
+            relayed, complete = await self.relay_batch()
+            if once and (not relayed or not complete):
+                return
+            if not complete:
+                await asyncio.sleep(RETRY_DELAY)
+            elif relayed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    def fetch(self):
+        return list(OutboxEvent.objects.order_by('id')[:self.batch_size])
+
+    def finish(self, delivered, failed):
+        OutboxEvent.objects.filter(pk__in=delivered).delete()
+        if failed is not None:
+            OutboxEvent.objects.filter(pk=failed).update(attempts=F('attempts') + 1)
+
+    async def relay_batch(self):
+        """Returns how many rows went out and whether the whole batch did."""
+        rows = await database_sync_to_async(self.fetch)()
+        delivered, failed = [], None
+        for row in rows:
+            try:
+                await send_to_groups(self.channel_layer, row.groups, {**row.event, 'dedupe_id': str(row.uid)})
+            except Exception:
+                logger.exception("Relaying outbox event %s failed after %d attempts", row.uid, row.attempts)
+                failed = row.pk
+                break
+            delivered.append(row.pk)
+        if rows:
+            await database_sync_to_async(self.finish)(delivered, failed)
+        self.stats['relayed'] += len(delivered)
+        self.stats['failed'] += failed is not None
+        self.stats['batches'] += bool(rows)
+        if delivered:
+            lag = (timezone.now() - rows[0].created).total_seconds() * 1000
+            self.stats['max_lag_ms'] = max(self.stats['max_lag_ms'], lag)
+        return len(delivered), failed is None
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.account.models import Profile
+from apps.account.services.blacklist import get_blacklist
+from apps.chat.models import Chat
+from apps.chat.services.broadcast import is_broadcast
+
+
+class PostDenied(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def not_member_error():
+    return PostDenied("شما عضو این چت نیستید و نمی‌توانید پیام ارسال کنید.")
+
+
+def blocked_error(username):
+    return PostDenied(f"شما بلاک شده‌اید از طرف {username}. نمی‌توانید پیام ارسال کنید.")
+
+
+def not_admin_error():
+    return PostDenied("فقط مدیران کانال می‌توانند در آن پیام ارسال کنند.")
+
+
+def first_username(user_ids):
+    return Profile.objects.filter(id__in=user_ids).order_by('username').values_list('username', flat=True).first()
+
+
+def check_can_post(chat_id, user_id):
+    if is_broadcast(chat_id):
+        check_can_broadcast(chat_id, user_id)
+        return
+    # Blockers come from the sender's cached blocked-by set; one query then
+    # tells which of them, and whether the sender, are in the chat.
+    blocked_by = get_blacklist(user_id)['blocked_by']
+    present = set(
+        Chat.participants.through.objects.filter(chat_id=chat_id, profile_id__in={user_id, *blocked_by})
+        .values_list('profile_id', flat=True)
+    )
+    if user_id not in present:
+        raise not_member_error()
+    blockers = present - {user_id}
+    if blockers:
+        raise blocked_error(first_username(blockers))
+
+
+def chat_acl_cache_key(chat_id):
+    return f'chat:{chat_id}:post_acl'
+
+
+def get_chat_members(chat_id):
+    key = chat_acl_cache_key(chat_id)
+    members = cache.get(key)
+    if members is None:
+        members = set(Chat.participants.through.objects.filter(chat_id=chat_id).values_list('profile_id', flat=True))
+        cache.set(key, members, settings.CHAT_ACL_CACHE_TIMEOUT)
+    return members
+
+
+def check_can_post_cached(chat_id, user_id):
+    # Same answer as check_can_post from two cache reads, for the hot WebSocket path.
+    if is_broadcast(chat_id):
+        check_can_broadcast(chat_id, user_id)
+        return
+    members = get_chat_members(chat_id)
+    if user_id not in members:
+        raise not_member_error()
+    blockers = (get_blacklist(user_id)['blocked_by'] & members) - {user_id}
+    if blockers:
+        raise blocked_error(first_username(blockers))
+
+
+def invalidate_chat_acl(*chat_ids):
+    cache.delete_many([chat_acl_cache_key(chat_id) for chat_id in chat_ids])
+
+
+def chat_admins_cache_key(chat_id):
+    return f'chat:{chat_id}:admins'
+
+
+def get_chat_admins(chat_id):
+    key = chat_admins_cache_key(chat_id)
+    admins = cache.get(key)
+    if admins is None:
+        admins = set(Chat.admins.through.objects.filter(chat_id=chat_id).values_list('profile_id', flat=True))
+        cache.set(key, admins, settings.CHAT_ACL_CACHE_TIMEOUT)
+    return admins
+
+
+def check_can_broadcast(chat_id, user_id):
+    # Broadcast channels have no blacklist rules: subscribers only read.
+    if user_id not in get_chat_admins(chat_id):
+        raise not_admin_error()
+
+
+def invalidate_chat_admins(*chat_ids):
+    cache.delete_many([chat_admins_cache_key(chat_id) for chat_id in chat_ids])
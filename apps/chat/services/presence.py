@@ -0,0 +1,175 @@
+import time
+import asyncio
+
+from django.conf import settings
+
+from apps.chat.services.fanout import chat_socket_groups, presence_event, send_to_groups, typing_event
+
+
+class MemoryPresenceStore:
+    """
+    In-process presence for tests and single-worker deployments.
+
+    A user is online in a chat while at least one of their connections to it
+    has heartbeated within the last ``ttl`` seconds.
+    """
+
+    def __init__(self):
+        self.connections = {}
+        self.throttles = {}
+
+    def live(self, key, now):
+        connections = self.connections.get(key, {})
+        for connection_id, expires in list(connections.items()):
+            if expires <= now:
+                del connections[connection_id]
+        return connections
+
+    async def heartbeat(self, chat_id, user_id, connection_id, ttl):
+        now = time.monotonic()
+        connections = self.live((chat_id, user_id), now)
+        was_online = bool(connections)
+        connections[connection_id] = now + ttl
+        self.connections[(chat_id, user_id)] = connections
+        return not was_online
+
+    async def disconnect(self, chat_id, user_id, connection_id):
+        connections = self.live((chat_id, user_id), time.monotonic())
+        was_online = bool(connections)
+        connections.pop(connection_id, None)
+        if not connections:
+            self.connections.pop((chat_id, user_id), None)
+        return was_online and not connections
+
+    async def online_users(self, chat_id):
+        now = time.monotonic()
+        keys = [key for key in self.connections if key[0] == chat_id]
+        return {user_id for _, user_id in keys if self.live((chat_id, user_id), now)}
+
+    async def throttle(self, key, seconds):
+        now = time.monotonic()
+        if self.throttles.get(key, 0) > now:
+            return False
+        if len(self.throttles) > 10000:
+            self.throttles = {k: expires for k, expires in self.throttles.items() if expires > now}
+        self.throttles[key] = now + seconds
+        return True
+
+
+class RedisPresenceStore:
+    """
+    Presence shared by every worker. Per (chat, user) a sorted set of
+    connection ids scored by expiry, plus a per-chat sorted set of online
+    users; each transition is one Lua script so concurrent workers agree on
+    who saw the online/offline edge. Keys share a {chat_id} hash tag.
+    """
+
+    HEARTBEAT = """
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+        local before = redis.call('ZCARD', KEYS[1])
+        redis.call('ZADD', KEYS[1], ARGV[2], ARGV[3])
+        redis.call('ZADD', KEYS[2], ARGV[2], ARGV[4])
+        redis.call('EXPIRE', KEYS[1], ARGV[5])
+        redis.call('EXPIRE', KEYS[2], ARGV[5])
+        return before == 0 and 1 or 0
+    """
+    DISCONNECT = """
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+        local before = redis.call('ZCARD', KEYS[1])
+        redis.call('ZREM', KEYS[1], ARGV[2])
+        if redis.call('ZCARD', KEYS[1]) > 0 then
+            return 0
+        end
+        redis.call('ZREM', KEYS[2], ARGV[3])
+        return before > 0 and 1 or 0
+    """
+
+    def __init__(self, url):
+        from redis import asyncio as redis
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.heartbeat_script = self.redis.register_script(self.HEARTBEAT)
+        self.disconnect_script = self.redis.register_script(self.DISCONNECT)
+
+    def keys(self, chat_id, user_id):
+        return [f'presence:{{{chat_id}}}:{user_id}', f'presence:{{{chat_id}}}']
+
+    async def heartbeat(self, chat_id, user_id, connection_id, ttl):
+        now = time.time()
+        args = [now, now + ttl, connection_id, user_id, int(ttl) + 1]
+        return bool(await self.heartbeat_script(keys=self.keys(chat_id, user_id), args=args))
+
+    async def disconnect(self, chat_id, user_id, connection_id):
+        args = [time.time(), connection_id, user_id]
+        return bool(await self.disconnect_script(keys=self.keys(chat_id, user_id), args=args))
+
+    async def online_users(self, chat_id):
+        return set(await self.redis.zrangebyscore(f'presence:{{{chat_id}}}', time.time(), '+inf'))
+
+    async def throttle(self, key, seconds):
+        return bool(await self.redis.set(f'throttle:{key}', 1, nx=True, px=int(seconds * 1000)))
+
+
+_store = None
+
+
+def get_presence_store():
+    global _store
+    if _store is None:
+        url = settings.CHAT_PRESENCE_REDIS_URL
+        _store = RedisPresenceStore(url) if url else MemoryPresenceStore()
+    return _store
+
+
+class TypingCoalescer:
+    """
+    Collects typing notifications per chat for ``window`` seconds and sends
+    one event naming everyone who typed, instead of one event per keystroke
+    burst per user.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.pending = {}
+        self.tasks = {}
+
+    async def add(self, channel_layer, chat_id, user_id):
+        typing = self.pending.get(chat_id)
+        if typing is not None:
+            typing.add(user_id)
+            return
+        self.pending[chat_id] = {user_id}
+        self.tasks[chat_id] = asyncio.create_task(self.flush_later(channel_layer, chat_id))
+
+    async def flush_later(self, channel_layer, chat_id):
+        await asyncio.sleep(self.window)
+        user_ids = self.pending.pop(chat_id)
+        self.tasks.pop(chat_id, None)
+        await send_to_groups(channel_layer, chat_socket_groups(chat_id), typing_event(chat_id, sorted(user_ids)))
+
+
+_coalescer = None
+
+
+def get_typing_coalescer():
+    global _coalescer
+    if _coalescer is None:
+        _coalescer = TypingCoalescer(settings.CHAT_TYPING_COALESCE_MS / 1000)
+    return _coalescer
+
+
+async def user_connected(channel_layer, chat_id, user_id, connection_id):
+    if await get_presence_store().heartbeat(chat_id, user_id, connection_id, settings.CHAT_PRESENCE_TTL):
+        await send_to_groups(channel_layer, chat_socket_groups(chat_id), presence_event(chat_id, user_id, True))
+
+
+async def user_disconnected(channel_layer, chat_id, user_id, connection_id):
+    if await get_presence_store().disconnect(chat_id, user_id, connection_id):
+        await send_to_groups(channel_layer, chat_socket_groups(chat_id), presence_event(chat_id, user_id, False))
+
+
+async def user_typing(channel_layer, chat_id, user_id):
+    # A user's repeated typing frames pass at most once per throttle interval, across all workers.
+    interval = settings.CHAT_TYPING_THROTTLE_MS / 1000
+    if await get_presence_store().throttle(f'typing:{chat_id}:{user_id}', interval):
+        await get_typing_coalescer().add(channel_layer, chat_id, user_id)
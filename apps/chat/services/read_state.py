@@ -0,0 +1,52 @@
+from django.db.models import Subquery
+
+from apps.chat.models import Chat, Message, ReadState
+from apps.chat.services.versions import bump_user_versions
+
+
+def start_read_states(pairs):
+    # New members start with everything already posted counted as read.
+    pairs = list(pairs)
+    if not pairs:
+        return
+    seqs = dict(
+        Chat.objects.filter(pk__in={chat_id for _, chat_id in pairs}).values_list('id', 'last_seq')
+    )
+    ReadState.objects.bulk_create(
+        [ReadState(user_id=user_id, chat_id=chat_id, last_read_seq=seqs.get(chat_id, 0)) for user_id, chat_id in pairs],
+        ignore_conflicts=True,
+    )
+
+
+def advance_own_cursors(messages):
+    # A sender has read what they wrote: move their cursor past their newest message in each chat.
+    newest = {}
+    for message in messages:
+        newest[(message.sender_id, message.chat_id)] = message
+    for (user_id, chat_id), message in newest.items():
+        ReadState.objects.filter(user_id=user_id, chat_id=chat_id, last_read_seq__lt=message.seq).update(
+            last_read_seq=message.seq, last_read_message=message,
+        )
+
+
+def mark_read(user_id, chat_id, message_id=None):
+    """
+    Move the user's read cursor forward to ``message_id`` (default: the newest
+    message) with a single UPDATE; the cursor never moves backwards.
+    """
+    if message_id is None:
+        target = Chat.objects.filter(pk=chat_id)
+        seq, message = Subquery(target.values('last_seq')[:1]), Subquery(target.values('last_message')[:1])
+    else:
+        target = Message.objects.filter(pk=message_id, chat_id=chat_id)
+        seq, message = Subquery(target.values('seq')[:1]), Subquery(target.values('id')[:1])
+
+    states = ReadState.objects.filter(user_id=user_id, chat_id=chat_id)
+    updated = states.filter(last_read_seq__lt=seq).update(last_read_seq=seq, last_read_message=message)
+    if not updated:
+        _, created = ReadState.objects.get_or_create(user_id=user_id, chat_id=chat_id)
+        if created:
+            states.filter(last_read_seq__lt=seq).update(last_read_seq=seq, last_read_message=message)
+    # Unread counts in the cached inbox change with the cursor.
+    bump_user_versions([user_id])
+    return states.select_related('chat').get()
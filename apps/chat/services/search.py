@@ -0,0 +1,105 @@
+import html
+
+from django.db import connection
+
+from apps.chat.models import Message
+
+FTS_TABLE = 'chat_message_fts'
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+# Private-use characters the database marks matches with; the snippet is
+# HTML-escaped before they become the tags above.
+MATCH_START = '\ue000'
+MATCH_END = '\ue001'
+SNIPPET_WORDS = 12
+
+
+class SearchNotSupported(Exception):
+    pass
+
+
+def fts_query(text):
+    # Each word becomes a quoted FTS5 string, so user input can never be parsed as query syntax.
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+def highlight(snippet):
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(MATCH_START, HIGHLIGHT_START).replace(MATCH_END, HIGHLIGHT_END)
+
+
+def rebuild_index():
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # External-content table: FTS5 re-reads every row of chat_message itself.
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute("REINDEX INDEX message_body_search_idx")
+        else:
+            raise SearchNotSupported(connection.vendor)
+
+
+class MessageSearch:
+    """
+    Ranked full-text search over the messages of the chats ``user`` belongs to.
+
+    Slicing runs the query with LIMIT/OFFSET and returns Message instances
+    annotated with ``rank`` (higher is better) and a highlighted ``snippet``:
+    HTML-escaped message text in which only the <mark> tags are markup.
+    """
+
+    def __init__(self, user, text, chat_id=None):
+        self.user = user
+        self.text = text
+        self.chat_id = chat_id
+
+    def chats_sql(self):
+        chats = self.user.chats.all()
+        if self.chat_id is not None:
+            chats = chats.filter(id=self.chat_id)
+        return chats.values('id').query.sql_with_params()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError("MessageSearch only supports slicing")
+        offset = key.start or 0
+        limit = key.stop - offset
+        if limit <= 0:
+            return []
+        if connection.vendor == 'sqlite':
+            sql, params = self.sqlite_sql()
+        elif connection.vendor == 'postgresql':
+            sql, params = self.postgresql_sql()
+        else:
+            raise SearchNotSupported(connection.vendor)
+        messages = list(Message.objects.raw(f"{sql} LIMIT %s OFFSET %s", [*params, limit, offset]))
+        for message in messages:
+            message.snippet = highlight(message.snippet)
+        return messages
+
+    def sqlite_sql(self):
+        chats_sql, chats_params = self.chats_sql()
+        table = Message._meta.db_table
+        sql = (
+            f"SELECT m.*, -bm25({FTS_TABLE}) AS rank, "
+            f"snippet({FTS_TABLE}, 0, %s, %s, '…', %s) AS snippet "
+            f"FROM {FTS_TABLE} JOIN {table} m ON m.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND m.chat_id IN ({chats_sql}) "
+            f"ORDER BY rank DESC, m.id DESC"
+        )
+        return sql, [MATCH_START, MATCH_END, SNIPPET_WORDS, fts_query(self.text), *chats_params]
+
+    def postgresql_sql(self):
+        chats_sql, chats_params = self.chats_sql()
+        table = Message._meta.db_table
+        # The expression must match message_body_search_idx exactly for the GIN index to be used.
+        sql = (
+            f"SELECT m.*, ts_rank(to_tsvector('simple', m.message), q) AS rank, "
+            f"ts_headline('simple', m.message, q, %s) AS snippet "
+            f"FROM {table} m, plainto_tsquery('simple', %s) q "
+            f"WHERE to_tsvector('simple', m.message) @@ q AND m.chat_id IN ({chats_sql}) "
+            f"ORDER BY rank DESC, m.id DESC"
+        )
+        options = f"StartSel={MATCH_START}, StopSel={MATCH_END}, MaxWords={SNIPPET_WORDS}, MinWords=3"
+        return sql, [options, self.text, *chats_params]
@@ -0,0 +1,109 @@
+import json
+import base64
+import binascii
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.utils import timezone
+from django.db.models import Max, Q
+
+from apps.chat.models import Chat, Message, SyncEvent
+
+
+class InvalidSyncToken(Exception):
+    pass
+
+
+def encode_token(base, seqs, event_id):
+    data = json.dumps({'b': int(base.timestamp() * 1000), 'c': seqs, 'e': event_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_token(token):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token.encode()))
+        base = datetime.fromtimestamp(int(data['b']) / 1000, tz=dt_timezone.utc)
+        seqs = {int(chat_id): int(seq) for chat_id, seq in data['c'].items()}
+        return base, seqs, int(data['e'])
+    except (binascii.Error, ValueError, TypeError, KeyError, AttributeError, OverflowError, OSError):
+        raise InvalidSyncToken()
+
+
+def record_events(kind, pairs):
+    pairs = list(pairs)
+    seqs = {}
+    if kind == SyncEvent.JOINED:
+        seqs = dict(Chat.objects.filter(pk__in={chat_id for _, chat_id in pairs}).values_list('id', 'last_seq'))
+    SyncEvent.objects.bulk_create([
+        SyncEvent(user_id=user_id, chat_id=chat_id, kind=kind, seq=seqs.get(chat_id)) for user_id, chat_id in pairs
+    ])
+
+
+def sync_base():
+    return timezone.now() - timedelta(seconds=settings.CHAT_SYNC_COMMIT_LAG)
+
+
+def current_token(user):
+    base = sync_base()
+    seqs = dict(user.chats.filter(last_message_at__gte=base, last_seq__gt=0).values_list('id', 'last_seq'))
+    event_id = user.sync_events.aggregate(last=Max('id'))['last'] or 0
+    return encode_token(base, seqs, event_id)
+
+
+def changes_since(user, token, limit):
+    """
+    Everything that changed for ``user`` after ``token``: new messages in the
+    user's chats and their own membership/favorite events, each capped at
+    ``limit`` rows.
+
+    The token holds a base time and, for chats active since then, the last
+    delivered seq; seqs commit in order under the chat's row lock, where ids
+    and timestamps do not. Every other chat is delivered up to the base, so
+    only chats with messages since the base are read and the token stays as
+    small as the recent activity. A chat joined since the token starts at
+    the seq recorded on its join event.
+    """
+    base, seqs, event_id = decode_token(token)
+    next_base = max(base, sync_base())
+
+    changed = {
+        chat_id: (last_seq, last_message_at)
+        for chat_id, last_seq, last_message_at in user.chats.filter(last_message_at__gte=base)
+        .values_list('id', 'last_seq', 'last_message_at')
+    }
+    joined = dict(
+        user.sync_events.filter(kind=SyncEvent.JOINED, id__gt=event_id, chat_id__in=changed, seq__isnull=False)
+        .order_by('id').values_list('chat_id', 'seq')
+    )
+    starts = {chat_id: seqs[chat_id] if chat_id in seqs else joined[chat_id]
+              for chat_id in changed if chat_id in seqs or chat_id in joined}
+    conditions = [
+        Q(chat_id=chat_id, seq__gt=starts[chat_id]) if chat_id in starts else Q(chat_id=chat_id, timestamp__gte=base)
+        for chat_id, (last_seq, _) in changed.items() if chat_id not in starts or last_seq > starts[chat_id]
+    ]
+    messages = []
+    if conditions:
+        messages = list(Message.objects.filter(reduce(or_, conditions)).order_by('chat_id', 'seq')[:limit + 1])
+    events = list(user.sync_events.filter(id__gt=event_id).order_by('id')[:limit + 1])
+
+    has_more = len(messages) > limit or len(events) > limit
+    messages, events = messages[:limit], events[:limit]
+    for message in messages:
+        starts[message.chat_id] = message.seq
+    if has_more:
+        # The base cannot move until every chat active since it has been read.
+        next_base, next_seqs = base, starts
+    else:
+        # Everything up to each chat's last_seq, read before the messages, was delivered.
+        next_seqs = {
+            chat_id: max(starts.get(chat_id, 0), last_seq)
+            for chat_id, (last_seq, last_message_at) in changed.items() if last_message_at >= next_base
+        }
+    next_token = encode_token(
+        next_base,
+        {chat_id: seq for chat_id, seq in next_seqs.items() if seq},
+        events[-1].id if events else event_id,
+    )
+    return messages, events, next_token, has_more
@@ -0,0 +1,69 @@
+import uuid
+
+from django.db import transaction
+from django.core.cache import cache
+
+from apps.chat.services.permissions import get_chat_members
+from apps.chat.services.broadcast import broadcast_chat_ids, get_user_broadcasts
+
+
+def user_version_key(user_id):
+    return f'profile:{user_id}:chat_version'
+
+
+def chat_version_key(chat_id):
+    return f'chat:{chat_id}:version'
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add() so a concurrent first request cannot overwrite a fresher bump.
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_user_version(user_id):
+    return get_version(user_version_key(user_id))
+
+
+def get_inbox_version(user_id):
+    # Broadcast chats carry their own version instead of bumping every
+    # subscriber's, so a user's chat lists depend on both.
+    keys = [user_version_key(user_id), *(chat_version_key(chat_id) for chat_id in sorted(get_user_broadcasts(user_id)))]
+    versions = cache.get_many(keys)
+    return '.'.join(versions[key] if key in versions else get_version(key) for key in keys)
+
+
+def bump_versions(keys):
+    """
+    Versions are opaque tokens, so one set_many covers any number of keys.
+    Inside a transaction the bump is repeated after commit, so a response
+    cached by a request that read the old rows in between does not survive.
+    """
+    if not keys:
+        return
+
+    def bump():
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+    bump()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def bump_user_versions(user_ids):
+    # Invalidates the cached chat-list responses of ``user_ids``.
+    bump_versions([user_version_key(user_id) for user_id in set(user_ids)])
+
+
+def bump_chat_members(*chat_ids):
+    broadcasts = broadcast_chat_ids(chat_ids)
+    bump_versions([chat_version_key(chat_id) for chat_id in broadcasts])
+    members = set()
+    for chat_id in chat_ids:
+        if int(chat_id) not in broadcasts:
+            members |= get_chat_members(chat_id)
+    bump_user_versions(members)
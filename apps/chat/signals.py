@@ -0,0 +1,86 @@
+from django.dispatch import receiver
+from django.db.models.signals import m2m_changed, post_save
+
+from apps.account.models import Profile
+from apps.chat.models import Chat, ReadState, SyncEvent
+from apps.chat.services.sync import record_events
+from apps.chat.services.read_state import start_read_states
+from apps.chat.services.broadcast import invalidate_chat_kind, invalidate_user_broadcasts
+from apps.chat.services.permissions import invalidate_chat_acl, invalidate_chat_admins
+from apps.chat.services.versions import bump_chat_members, bump_user_versions
+
+
+@receiver(m2m_changed, sender=Chat.participants.through)
+def participants_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_chat_acl(instance.pk)
+    elif pk_set is not None:
+        invalidate_chat_acl(*pk_set)
+    else:
+        invalidate_chat_acl(*instance.chats.values_list('id', flat=True))
+
+    if action == 'pre_clear':
+        if reverse:
+            pairs = [(instance.pk, chat_id) for chat_id in instance.chats.values_list('id', flat=True)]
+        else:
+            pairs = [(user_id, instance.pk) for user_id in instance.participants.values_list('id', flat=True)]
+        record_events(SyncEvent.LEFT, pairs)
+        bump_chat_members(*{chat_id for _, chat_id in pairs})
+        invalidate_user_broadcasts(user_id for user_id, _ in pairs)
+        return
+
+    pairs = [(instance.pk, pk) if reverse else (pk, instance.pk) for pk in pk_set]
+    # Everyone still in the affected chats sees the member list change, plus whoever left.
+    bump_chat_members(*{chat_id for _, chat_id in pairs})
+    bump_user_versions(user_id for user_id, _ in pairs)
+    invalidate_user_broadcasts(user_id for user_id, _ in pairs)
+    if action == 'post_add':
+        start_read_states(pairs)
+        record_events(SyncEvent.JOINED, pairs)
+    elif action == 'post_remove':
+        lookup = {'user': instance.pk, 'chat__in': pk_set} if reverse else {'chat': instance.pk, 'user__in': pk_set}
+        ReadState.objects.filter(**lookup).delete()
+        record_events(SyncEvent.LEFT, pairs)
+
+
+@receiver(m2m_changed, sender=Profile.favorits.through)
+def favorites_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            pairs = [(user_id, instance.pk) for user_id in instance.favorited_by.values_list('id', flat=True)]
+        else:
+            pairs = [(instance.pk, chat_id) for chat_id in instance.favorits.values_list('id', flat=True)]
+        record_events(SyncEvent.UNFAVORITED, pairs)
+    elif action in ('post_add', 'post_remove'):
+        pairs = [(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set]
+        record_events(SyncEvent.FAVORITED if action == 'post_add' else SyncEvent.UNFAVORITED, pairs)
+    else:
+        return
+    bump_user_versions(user_id for user_id, _ in pairs)
+
+
+@receiver(m2m_changed, sender=Chat.admins.through)
+def admins_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_chat_admins(instance.pk)
+    elif action == 'pre_clear':
+        invalidate_chat_admins(*instance.administered_chats.values_list('id', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_chat_admins(*pk_set)
+
+
+@receiver(post_save, sender=Chat)
+def chat_saved(sender, instance, **kwargs):
+    # Also on create: a lookup of a not-yet-existing id caches it as not broadcast.
+    invalidate_chat_kind(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+def profile_renamed(sender, instance, created, update_fields, **kwargs):
+    # Chat lists show member usernames (direct-chat names, last message sender).
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    bump_chat_members(*instance.chats.values_list('id', flat=True))
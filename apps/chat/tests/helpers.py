@@ -0,0 +1,21 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountMixin:
+    """
+    For TestCase classes: catches N+1 regressions by checking that a request
+    costs the same number of queries before and after the data grows.
+    """
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        return len(queries)
+
+    def assertConstantQueries(self, func, grow, times=2):
+        baseline = self.count_queries(func)
+        for _ in range(times):
+            grow()
+            self.assertEqual(self.count_queries(func), baseline)
+        return baseline
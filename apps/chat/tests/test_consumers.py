@@ -0,0 +1,393 @@
+import asyncio
+from unittest.mock import patch
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+from django.contrib.auth.models import AnonymousUser
+
+from apps.account.models import Profile
+from apps.chat.models import Chat, Message
+from apps.chat.api.routing import websocket_urlpatterns
+from apps.chat.services.messages import store_message
+from apps.chat.services.read_state import mark_read
+from apps.chat.consumers import SLOW_CONSUMER_CLOSE_CODE, FrameBatchingMixin
+from apps.chat.services.backpressure import DISCONNECT, RESYNC
+from apps.chat.services.fanout import chat_socket_groups, message_event, read_event, send_to_groups
+from apps.chat.services.presence import MemoryPresenceStore, get_presence_store
+from apps.chat.services.outbox import OutboxRelay
+from apps.chat.api.serializers.chat import MessageEventSerializer
+
+
+IN_MEMORY_CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ChatConsumerTest(TransactionTestCase):
+    def setUp(self):
+        self.user = Profile.objects.create(username='user', password='password')
+        self.participant = Profile.objects.create(username='user1', password='password')
+        self.outsider = Profile.objects.create(username='user2', password='password')
+
+        self.chat = Chat.objects.create(name="test_chat", create_by=self.user, is_group=True)
+        self.chat.participants.add(self.user, self.participant)
+
+        for name, value in (('_store', MemoryPresenceStore()), ('_coalescer', None)):
+            patcher = patch(f'apps.chat.services.presence.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def connect(self, user, query=''):
+        path = f"/ws/chat/{self.chat.id}/{query}"
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_outsider_is_rejected(self):
+        communicator, connected = await self.connect(self.outsider)
+        self.assertFalse(connected)
+
+    async def test_non_numeric_chat_id_is_not_routed(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/chat/abc/")
+        communicator.scope['user'] = self.user
+        with self.assertRaises(ValueError):
+            await communicator.connect()
+
+    async def test_send_persists_acks_and_fans_out(self):
+        sender, _ = await self.connect(self.user)
+        receiver, _ = await self.connect(self.participant)
+
+        await sender.send_json_to({"message": "Hello!", "client_id": "c-1"})
+
+        frames = [await sender.receive_json_from(), await sender.receive_json_from()]
+        ack = next(frame for frame in frames if frame.get('type') == 'ack')
+        self.assertEqual(ack['client_id'], "c-1")
+        message = await Message.objects.aget(id=ack['id'])
+        self.assertEqual(message.message, "Hello!")
+
+        broadcast = await receiver.receive_json_from()
+        self.assertEqual(broadcast['v'], 1)
+        self.assertEqual(broadcast['type'], 'message')
+        self.assertEqual(broadcast['id'], message.id)
+        self.assertEqual(broadcast['chat_id'], self.chat.id)
+        self.assertEqual(broadcast['sender_id'], str(self.user.id))
+        self.assertEqual(broadcast['body'], "Hello!")
+
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    @override_settings(CHAT_GROUP_SHARDS=4)
+    async def test_sockets_spread_over_shards(self):
+        sender, _ = await self.connect(self.user)
+        receivers = [(await self.connect(self.participant))[0] for _ in range(12)]
+        layer = get_channel_layer()
+        self.assertGreater(sum(bool(layer.groups.get(group)) for group in chat_socket_groups(self.chat.id)), 1)
+
+        await sender.send_json_to({"message": "Hello!"})
+        for receiver in receivers:
+            self.assertEqual((await receiver.receive_json_from())['body'], "Hello!")
+
+        for communicator in [sender, *receivers]:
+            await communicator.disconnect()
+
+    async def test_blocked_sender_gets_error(self):
+        await self.participant.blacklist.aadd(self.user)
+        sender, _ = await self.connect(self.user)
+
+        await sender.send_json_to({"message": "Hello!", "client_id": "c-2"})
+        error = await sender.receive_json_from()
+        self.assertEqual(error['type'], 'error')
+        self.assertEqual(error['client_id'], "c-2")
+        self.assertFalse(await Message.objects.filter(chat=self.chat).aexists())
+
+        await sender.disconnect()
+
+    async def test_compact_frames(self):
+        sender, _ = await self.connect(self.user)
+        receiver, _ = await self.connect(self.participant, query='?compact=1')
+
+        await sender.send_json_to({"message": "Hello!"})
+        frame = await receiver.receive_json_from()
+        self.assertEqual(frame['e'], 'message')
+        self.assertEqual(frame['c'], self.chat.id)
+        self.assertEqual(frame['b'], "Hello!")
+
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    @override_settings(CHAT_WS_BATCH_WINDOW_MS=50, CHAT_WS_BATCH_MAX_SIZE=10)
+    async def test_batched_frames(self):
+        sender, _ = await self.connect(self.user)
+        batched, _ = await self.connect(self.participant, query='?batch=1')
+
+        for i in range(3):
+            await sender.send_json_to({"message": f"message {i}"})
+
+        frame = await batched.receive_json_from(timeout=2)
+        self.assertIsInstance(frame, list)
+        self.assertEqual(len(frame), 3)
+        self.assertEqual(frame[2]['body'], "message 2")
+        self.assertTrue(await batched.receive_nothing())
+
+        await sender.disconnect()
+        await batched.disconnect()
+
+    @override_settings(CHAT_WS_BATCH_WINDOW_MS=10000, CHAT_WS_BATCH_MAX_SIZE=2)
+    async def test_batch_flushes_at_max_size(self):
+        sender, _ = await self.connect(self.user)
+        batched, _ = await self.connect(self.participant, query='?batch=1')
+
+        for i in range(2):
+            await sender.send_json_to({"message": f"message {i}"})
+
+        frame = await batched.receive_json_from(timeout=2)
+        self.assertEqual(len(frame), 2)
+
+        await sender.disconnect()
+        await batched.disconnect()
+
+    async def test_read_receipt_event(self):
+        receiver, _ = await self.connect(self.participant)
+        message = await database_sync_to_async(store_message)(self.chat.id, self.participant, "Hello!")
+        state = await database_sync_to_async(mark_read)(self.user.id, self.chat.id)
+        await send_to_groups(get_channel_layer(), chat_socket_groups(self.chat.id), read_event(state))
+
+        frame = await receiver.receive_json_from()
+        self.assertEqual(frame['type'], 'read')
+        self.assertEqual(frame['user_id'], str(self.user.id))
+        self.assertEqual(frame['last_read_id'], message.id)
+        self.assertEqual(frame['last_read_seq'], 1)
+
+        await receiver.disconnect()
+
+    async def test_relayed_duplicates_are_dropped(self):
+        receiver, _ = await self.connect(self.participant)
+        message = await database_sync_to_async(store_message)(self.chat.id, self.user, "Hello!")
+        data = await database_sync_to_async(lambda: MessageEventSerializer(message).data)()
+        event = {**message_event(data), 'dedupe_id': 'outbox-1'}
+        for _ in range(2):
+            await send_to_groups(get_channel_layer(), chat_socket_groups(self.chat.id), event)
+
+        self.assertEqual((await receiver.receive_json_from())['id'], message.id)
+        self.assertTrue(await receiver.receive_nothing())
+        await receiver.disconnect()
+
+    @override_settings(CHAT_FANOUT_MODE='outbox')
+    async def test_outbox_mode_delivers_through_the_relay(self):
+        sender, _ = await self.connect(self.user)
+        receiver, _ = await self.connect(self.participant)
+        await sender.send_json_to({"message": "Hello!"})
+        self.assertEqual((await sender.receive_json_from())['type'], 'ack')
+        self.assertTrue(await receiver.receive_nothing())
+
+        await OutboxRelay(get_channel_layer(), batch_size=100, poll_interval=0).run(once=True)
+        self.assertEqual((await receiver.receive_json_from())['body'], "Hello!")
+
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    async def test_presence_transitions(self):
+        watcher, _ = await self.connect(self.user, query='?presence=1')
+        snapshot = await watcher.receive_json_from()
+        self.assertEqual(snapshot['type'], 'presence_snapshot')
+        self.assertEqual(snapshot['user_ids'], [str(self.user.id)])
+
+        first, _ = await self.connect(self.participant)
+        frame = await watcher.receive_json_from()
+        self.assertEqual((frame['type'], frame['user_id'], frame['online']), ('presence', str(self.participant.id), True))
+
+        # A second connection and its heartbeats do not change the participant's status.
+        second, _ = await self.connect(self.participant)
+        await second.send_json_to({"type": "heartbeat"})
+        await second.disconnect()
+        self.assertTrue(await watcher.receive_nothing())
+
+        await first.disconnect()
+        frame = await watcher.receive_json_from()
+        self.assertEqual((frame['type'], frame['online']), ('presence', False))
+
+        await watcher.disconnect()
+
+    @override_settings(CHAT_PRESENCE_TTL=0.3)
+    async def test_idle_connection_stays_online(self):
+        watcher, _ = await self.connect(self.user, query='?presence=1')
+        await watcher.receive_json_from()
+        participant, _ = await self.connect(self.participant)
+        frame = await watcher.receive_json_from()
+        self.assertEqual((frame['user_id'], frame['online']), (str(self.participant.id), True))
+
+        # No heartbeat frames from the client, well past the TTL: no repeated online edge.
+        self.assertTrue(await watcher.receive_nothing(timeout=1))
+        online = await get_presence_store().online_users(self.chat.pk)
+        self.assertEqual(online, {str(self.user.id), str(self.participant.id)})
+
+        await participant.disconnect()
+        frame = await watcher.receive_json_from()
+        self.assertEqual((frame['user_id'], frame['online']), (str(self.participant.id), False))
+        await watcher.disconnect()
+
+    async def test_presence_frames_are_opt_in(self):
+        watcher, _ = await self.connect(self.user)
+        participant, _ = await self.connect(self.participant)
+        await participant.send_json_to({"type": "typing"})
+        await participant.disconnect()
+        self.assertTrue(await watcher.receive_nothing(timeout=0.5))
+
+        await watcher.disconnect()
+
+    @override_settings(CHAT_TYPING_COALESCE_MS=100, CHAT_TYPING_THROTTLE_MS=10000)
+    async def test_typing_is_throttled_and_coalesced(self):
+        watcher, _ = await self.connect(self.user, query='?presence=1')
+        await watcher.receive_json_from()
+        typist, _ = await self.connect(self.participant, query='?presence=1')
+        await watcher.receive_json_from()
+        await typist.receive_json_from()
+
+        for _ in range(5):
+            await typist.send_json_to({"type": "typing"})
+        await watcher.send_json_to({"type": "typing"})
+
+        frame = await watcher.receive_json_from(timeout=2)
+        self.assertEqual(frame['type'], 'typing')
+        self.assertEqual(frame['user_ids'], sorted([str(self.user.id), str(self.participant.id)]))
+        self.assertTrue(await watcher.receive_nothing(timeout=0.3))
+
+        await typist.disconnect()
+        await watcher.disconnect()
+
+    async def slow_receiver(self, policy):
+        original = FrameBatchingMixin.send_frame
+
+        async def slow_send_frame(consumer, frame):
+            await asyncio.sleep(0.2)
+            await original(consumer, frame)
+
+        with override_settings(CHAT_WS_OUTBOUND_QUEUE_SIZE=2, CHAT_WS_OVERFLOW_POLICY=policy):
+            receiver, _ = await self.connect(self.participant)
+        patcher = patch.object(FrameBatchingMixin, 'send_frame', slow_send_frame)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for i in range(6):
+            data = {'id': i, 'chat_id': self.chat.id, 'body': f"message {i}"}
+            await send_to_groups(get_channel_layer(), chat_socket_groups(self.chat.id), message_event(data))
+        return receiver
+
+    async def test_slow_client_gets_resync_marker(self):
+        receiver = await self.slow_receiver(RESYNC)
+        frames = [await receiver.receive_json_from(timeout=2) for _ in range(3)]
+        self.assertEqual([frame['type'] for frame in frames], ['message', 'resync', 'message'])
+        self.assertEqual(frames[2]['id'], 5)
+        self.assertTrue(await receiver.receive_nothing(timeout=0.5))
+
+        await receiver.disconnect()
+
+    async def test_slow_client_is_disconnected(self):
+        receiver = await self.slow_receiver(DISCONNECT)
+        output = await receiver.receive_output(timeout=2)
+        while output['type'] != 'websocket.close':
+            output = await receiver.receive_output(timeout=2)
+        self.assertEqual(output['code'], SLOW_CONSUMER_CLOSE_CODE)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class UserConsumerTest(TransactionTestCase):
+    def setUp(self):
+        self.user = Profile.objects.create(username='user', password='password')
+        self.participant = Profile.objects.create(username='user1', password='password')
+
+        self.chats = [Chat.objects.create(name=f"chat_{i}", create_by=self.user, is_group=True) for i in range(3)]
+        for chat in self.chats:
+            chat.participants.add(self.user, self.participant)
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/user/")
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_anonymous_is_rejected(self):
+        communicator, connected = await self.connect(AnonymousUser())
+        self.assertFalse(connected)
+
+    async def test_one_socket_receives_every_chat(self):
+        sender, _ = await self.connect(self.user)
+        receiver, _ = await self.connect(self.participant)
+
+        for chat in self.chats:
+            await sender.send_json_to({"chat_id": chat.id, "message": f"to {chat.name}", "client_id": chat.name})
+        frames = [await receiver.receive_json_from() for _ in self.chats]
+        self.assertEqual([frame['chat_id'] for frame in frames], [chat.id for chat in self.chats])
+        self.assertEqual(frames[1]['body'], "to chat_1")
+
+        acks = [frame for frame in [await sender.receive_json_from() for _ in range(6)] if frame['type'] == 'ack']
+        self.assertEqual([ack['chat_id'] for ack in acks], [chat.id for chat in self.chats])
+
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    async def test_chat_socket_messages_reach_user_socket(self):
+        receiver, _ = await self.connect(self.participant)
+        path = f"/ws/chat/{self.chats[0].id}/"
+        sender = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        sender.scope['user'] = self.user
+        await sender.connect()
+
+        await sender.send_json_to({"message": "Hello!"})
+        frame = await receiver.receive_json_from()
+        self.assertEqual((frame['chat_id'], frame['body']), (self.chats[0].id, "Hello!"))
+
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    async def test_not_member(self):
+        outsider = await Profile.objects.acreate(username='user2', password='password')
+        sender, _ = await self.connect(outsider)
+        await sender.send_json_to({"chat_id": self.chats[0].id, "message": "Hello!"})
+        error = await sender.receive_json_from()
+        self.assertEqual(error['type'], 'error')
+
+        await sender.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class BroadcastConsumerTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = Profile.objects.create(username='admin', password='password')
+        self.subscribers = [Profile.objects.create(username=f'subscriber{i}', password='password') for i in range(3)]
+
+        self.chat = Chat.objects.create(name="news", create_by=self.admin, is_group=True, is_broadcast=True)
+        self.chat.participants.add(self.admin, *self.subscribers)
+        self.chat.admins.add(self.admin)
+
+    async def connect(self, user, path):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator
+
+    async def test_admin_post_reaches_every_subscriber_socket(self):
+        sender = await self.connect(self.admin, f"/ws/chat/{self.chat.id}/")
+        receivers = [await self.connect(self.subscribers[0], f"/ws/chat/{self.chat.id}/")]
+        receivers += [await self.connect(subscriber, "/ws/user/") for subscriber in self.subscribers[1:]]
+
+        await sender.send_json_to({"message": "news!"})
+        for receiver in receivers:
+            frame = await receiver.receive_json_from()
+            self.assertEqual((frame['chat_id'], frame['body']), (self.chat.id, "news!"))
+            self.assertTrue(await receiver.receive_nothing())
+
+        for communicator in [sender, *receivers]:
+            await communicator.disconnect()
+
+    async def test_subscriber_cannot_post(self):
+        communicator = await self.connect(self.subscribers[0], f"/ws/chat/{self.chat.id}/")
+        await communicator.send_json_to({"message": "hi"})
+        error = await communicator.receive_json_from()
+        self.assertEqual(error['type'], 'error')
+        await communicator.disconnect()
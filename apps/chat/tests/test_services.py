@@ -0,0 +1,282 @@
+import json
+from unittest.mock import AsyncMock, patch
+
+from asgiref.sync import async_to_sync
+from django.db import OperationalError, transaction
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from apps.account.models import Profile
+from apps.account.services.blacklist import get_blacklist, is_blocked_by
+from apps.chat.models import Chat, Message, OutboxEvent
+from apps.chat.services.backpressure import DISCONNECT, DROP_OLDEST, RESYNC, RESYNC_FRAME, OutboundQueue, \
+    SlowConsumer
+from apps.chat.services.ingestion import IngestionQueueFull, MessageIngestor
+from apps.chat.services.permissions import PostDenied, check_can_post, check_can_post_cached
+from apps.chat.services.fanout import EVENT_VERSION, chat_group_for, chat_groups, chat_socket_groups, compact_frame, \
+    message_event
+from apps.chat.services.messages import store_message, store_messages
+from apps.chat.services.versions import get_inbox_version, get_user_version
+from apps.chat.services.outbox import OutboxRelay, RecentIds
+
+
+class CheckCanPostTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Profile.objects.create(username='user', password='password')
+        self.member = Profile.objects.create(username='member', password='password')
+        self.outsider = Profile.objects.create(username='outsider', password='password')
+
+        self.chat = Chat.objects.create(name="group", create_by=self.user, is_group=True)
+        self.chat.participants.add(self.user, self.member)
+
+    def test_allowed(self):
+        check_can_post(self.chat.id, self.user.id)
+        # The sender's blacklist sets are cached now; only membership is queried.
+        with self.assertNumQueries(1):
+            check_can_post(self.chat.id, self.user.id)
+        check_can_post_cached(self.chat.id, self.user.id)
+
+    def test_not_member(self):
+        for check in (check_can_post, check_can_post_cached):
+            with self.assertRaises(PostDenied):
+                check(self.chat.id, self.outsider.id)
+
+    def test_blocked(self):
+        self.member.blacklist.add(self.user)
+        for check in (check_can_post, check_can_post_cached):
+            with self.assertRaises(PostDenied) as denied:
+                check(self.chat.id, self.user.id)
+            self.assertIn(self.member.username, denied.exception.message)
+
+    def test_cached_check_invalidation(self):
+        check_can_post_cached(self.chat.id, self.user.id)
+        with self.assertNumQueries(0):
+            check_can_post_cached(self.chat.id, self.user.id)
+
+        self.member.blacklist.add(self.user)
+        with self.assertRaises(PostDenied):
+            check_can_post_cached(self.chat.id, self.user.id)
+
+        self.chat.participants.add(self.outsider)
+        check_can_post_cached(self.chat.id, self.outsider.id)
+
+
+@override_settings(CHAT_GROUP_SHARDS=8)
+class GroupShardingTest(SimpleTestCase):
+    def test_sockets_spread_over_every_shard(self):
+        groups = chat_socket_groups(5)
+        self.assertEqual(groups, [f'chat_5_{shard}' for shard in range(8)])
+        assigned = [chat_group_for(5, f'specific.worker!{i}') for i in range(400)]
+        self.assertEqual(set(assigned), set(groups))
+        self.assertEqual(chat_group_for(5, 'specific.worker!7'), assigned[7])
+
+    @override_settings(CHAT_GROUP_SHARDS=1)
+    def test_single_shard(self):
+        self.assertEqual(chat_socket_groups(5), ['chat_5_0'])
+        self.assertEqual(chat_group_for(5, 'specific.worker!7'), 'chat_5_0')
+
+
+class FrameEventTest(SimpleTestCase):
+    def test_compact_frame_is_derived_on_demand(self):
+        event = message_event({'id': 1, 'chat_id': 5, 'body': "سلام"})
+        self.assertEqual(set(event), {'type', 'frame'})
+        self.assertEqual(json.loads(compact_frame(event['frame'])), {'v': EVENT_VERSION, 'e': 'message', 'i': 1, 'c': 5, 'b': "سلام"})
+
+
+class BroadcastChatTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = Profile.objects.create(username='admin', password='password')
+        self.subscriber = Profile.objects.create(username='subscriber', password='password')
+
+        self.chat = Chat.objects.create(name="news", create_by=self.admin, is_group=True, is_broadcast=True)
+        self.chat.participants.add(self.admin, self.subscriber)
+        self.chat.admins.add(self.admin)
+
+    def test_only_admins_post(self):
+        check_can_post(self.chat.id, self.admin.id)
+        check_can_post_cached(self.chat.id, self.admin.id)
+        for check in (check_can_post, check_can_post_cached):
+            with self.assertRaises(PostDenied):
+                check(self.chat.id, self.subscriber.id)
+
+    def test_fan_out_goes_to_shards(self):
+        self.assertEqual(chat_groups(self.chat.id), chat_socket_groups(self.chat.id, broadcast=True))
+
+    def test_post_bumps_the_channel_not_each_subscriber(self):
+        user_version, inbox_version = get_user_version(self.subscriber.pk), get_inbox_version(self.subscriber.pk)
+        store_message(self.chat.id, self.admin, "hello")
+        self.assertEqual(get_user_version(self.subscriber.pk), user_version)
+        self.assertNotEqual(get_inbox_version(self.subscriber.pk), inbox_version)
+
+
+@override_settings(CHAT_FANOUT_MODE='outbox')
+class OutboxTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Profile.objects.create(username='user', password='password')
+        self.member = Profile.objects.create(username='member', password='password')
+        self.chat = Chat.objects.create(name="group", create_by=self.user, is_group=True)
+        self.chat.participants.add(self.user, self.member)
+
+    def relay(self, layer):
+        relay = OutboxRelay(layer, batch_size=100, poll_interval=0)
+        async_to_sync(relay.run)(once=True)
+        return relay
+
+    def test_event_commits_with_message(self):
+        message = store_message(self.chat.id, self.user, "hello")
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.groups, chat_groups(self.chat.id))
+        self.assertEqual(json.loads(event.event['frame'])['uid'], str(message.uid))
+
+    def test_rolled_back_message_leaves_no_event(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            store_message(self.chat.id, self.user, "hello")
+            raise ValueError()
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_relay_sends_each_event_with_its_dedupe_id(self):
+        store_message(self.chat.id, self.user, "one")
+        store_message(self.chat.id, self.user, "two")
+        uids = [str(uid) for uid in OutboxEvent.objects.order_by('id').values_list('uid', flat=True)]
+        layer = AsyncMock()
+        relay = self.relay(layer)
+
+        groups = chat_groups(self.chat.id)
+        self.assertEqual(layer.group_send.await_count, 2 * len(groups))
+        sent = [call.args[1]['dedupe_id'] for call in layer.group_send.await_args_list]
+        self.assertEqual(sent, [uids[0]] * len(groups) + [uids[1]] * len(groups))
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(relay.stats['relayed'], 2)
+
+    def test_failed_send_is_kept_for_retry(self):
+        store_message(self.chat.id, self.user, "one")
+        layer = AsyncMock()
+        layer.group_send.side_effect = ConnectionError()
+        with self.assertLogs('apps.chat.services.outbox', 'ERROR'):
+            relay = self.relay(layer)
+        self.assertEqual(OutboxEvent.objects.get().attempts, 1)
+        self.assertEqual(relay.stats['failed'], 1)
+
+    def test_recent_ids(self):
+        recent = RecentIds(2)
+        self.assertEqual([recent.seen(item) for item in 'aab'], [False, True, False])
+        recent.seen('c')
+        self.assertFalse(recent.seen('a'))
+
+
+class BlacklistCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = Profile.objects.create(username='user', password='password')
+        self.other = Profile.objects.create(username='other', password='password')
+
+    def test_sets_and_invalidation(self):
+        self.assertEqual(get_blacklist(self.user.pk), {'blocked': set(), 'blocked_by': set()})
+        self.other.blacklist.add(self.user)
+        with self.assertNumQueries(1):
+            self.assertTrue(is_blocked_by(self.user.pk, self.other.pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_blocked_by(self.user.pk, self.other.pk))
+        self.assertEqual(get_blacklist(self.other.pk)['blocked'], {self.user.pk})
+
+        self.user.blocked_by.clear()
+        self.assertFalse(is_blocked_by(self.user.pk, self.other.pk))
+        self.assertEqual(get_blacklist(self.other.pk)['blocked'], set())
+
+
+class MessageIngestorTest(TransactionTestCase):
+    def setUp(self):
+        self.user = Profile.objects.create(username='user', password='password')
+        self.chat = Chat.objects.create(name="group", create_by=self.user, is_group=True)
+        self.chat.participants.add(self.user)
+
+    def test_flush_on_shutdown(self):
+        ingestor = MessageIngestor(batch_size=3, flush_interval=60, max_queue=100)
+        ingestor.start()
+        queued = [
+            ingestor.submit(Message(chat_id=self.chat.id, sender=self.user, message=f"message {i}")) for i in range(7)
+        ]
+        ingestor.stop()
+
+        stored = list(Message.objects.filter(chat=self.chat).order_by('id'))
+        self.assertEqual([message.uid for message in stored], [message.uid for message in queued])
+        self.assertEqual([message.timestamp for message in stored], [message.timestamp for message in queued])
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.message_count, 7)
+        self.assertEqual(self.chat.last_message_id, stored[-1].id)
+
+        metrics = ingestor.metrics()
+        self.assertEqual(metrics['flushed'], 7)
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertGreaterEqual(metrics['batches'], 3)
+
+    def test_transient_failure_is_retried(self):
+        ingestor = MessageIngestor(batch_size=10, flush_interval=0.01, max_queue=100)
+        queued = [ingestor.submit(Message(chat_id=self.chat.id, sender=self.user, message=f"m{i}")) for i in range(3)]
+        failures = [OperationalError("database table is locked")]
+
+        def flaky(messages):
+            if failures:
+                raise failures.pop()
+            return store_messages(messages)
+
+        with patch('apps.chat.services.ingestion.store_messages', flaky), self.assertLogs(level='ERROR'):
+            ingestor.flush()
+            self.assertEqual(ingestor.metrics()['queue_depth'], 3)
+            self.assertGreater(ingestor.retry_delay, 0)
+            ingestor.flush()
+
+        stored = Message.objects.filter(chat=self.chat).order_by('id').values_list('uid', flat=True)
+        self.assertEqual(list(stored), [message.uid for message in queued])
+        metrics = ingestor.metrics()
+        self.assertEqual((metrics['flushed'], metrics['requeued'], metrics['dropped']), (3, 3, 0))
+        self.assertEqual(ingestor.retry_delay, 0)
+
+    def test_rejected_message_is_dropped(self):
+        ingestor = MessageIngestor(batch_size=10, flush_interval=60, max_queue=100)
+        stored = store_message(self.chat.id, self.user, "stored")
+        duplicate = Message(chat_id=self.chat.id, sender=self.user, message="dup", uid=stored.uid)
+        ingestor.submit(duplicate)
+        ingestor.submit(Message(chat_id=self.chat.id, sender=self.user, message="fine"))
+
+        with self.assertLogs(level='ERROR'):
+            ingestor.flush()
+        metrics = ingestor.metrics()
+        self.assertEqual((metrics['flushed'], metrics['dropped'], metrics['queue_depth']), (1, 1, 0))
+        self.assertTrue(Message.objects.filter(message="fine").exists())
+
+    def test_bounded_queue(self):
+        ingestor = MessageIngestor(batch_size=10, flush_interval=60, max_queue=2)
+        ingestor.submit(Message(chat_id=self.chat.id, sender=self.user, message="a"))
+        ingestor.submit(Message(chat_id=self.chat.id, sender=self.user, message="b"))
+        with self.assertRaises(IngestionQueueFull):
+            ingestor.submit(Message(chat_id=self.chat.id, sender=self.user, message="c"))
+
+
+class OutboundQueueTest(SimpleTestCase):
+    def fill(self, policy, count=5):
+        queue = OutboundQueue(max_size=3, policy=policy)
+        for i in range(count):
+            queue.push(f'"frame {i}"')
+        return queue
+
+    def drain(self, queue):
+        return [queue.pop() for _ in range(len(queue))]
+
+    def test_drop_oldest(self):
+        queue = self.fill(DROP_OLDEST)
+        self.assertEqual(self.drain(queue), ['"frame 2"', '"frame 3"', '"frame 4"'])
+        self.assertEqual(queue.dropped, 2)
+
+    def test_resync(self):
+        queue = self.fill(RESYNC)
+        # frame 3 overflowed the queue and replaced frames 0-2 with the marker.
+        self.assertEqual(self.drain(queue), [RESYNC_FRAME, '"frame 3"', '"frame 4"'])
+        self.assertEqual(queue.dropped, 3)
+
+    def test_disconnect(self):
+        with self.assertRaises(SlowConsumer):
+            self.fill(DISCONNECT)
@@ -1,11 +1,29 @@
+import json
+import base64
+from io import StringIO
+from datetime import timedelta
+from unittest.mock import AsyncMock, patch
+
 from django.urls import reverse
+from django.utils import timezone
+from django.db import connection
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from apps.account.models import Profile
-from apps.chat.models import Chat, Message
+from apps.chat.models import Chat, Message, OutboxEvent, ReadState
+from apps.chat.api.views.chat import ListChatFilterAPIView
+from apps.chat.services.messages import store_message, store_messages
+from apps.chat.services.sync import decode_token
+from apps.chat.services.ingestion import MessageIngestor
+from apps.chat.services.broadcast import get_user_broadcasts
+from apps.chat.tests.helpers import QueryCountMixin
 
 
 class ChatAPIViewTest(APITestCase):
@@ -98,6 +116,53 @@ class ChatAPIViewTest(APITestCase):
         response = self.client.get(url, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_get_chats_inbox(self):
+        own_chat = Chat.objects.create(name="own_chat", create_by=self.user, is_group=False)
+        own_chat.participants.add(self.user, self.participant1)
+        other_chat = Chat.objects.create(name="other_chat", create_by=self.participant1, is_group=False)
+        other_chat.participants.add(self.participant1, self.participant2)
+        store_message(own_chat.id, self.participant1, "x" * 500)
+
+        url = reverse('chat')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([chat['id'] for chat in response.data['results']], [own_chat.id])
+        self.assertNotIn('messages', response.data['results'][0])
+        last_message = response.data['results'][0]['last_message']
+        self.assertEqual(last_message['sender_username'], self.participant1.username)
+        self.assertLess(len(last_message['message']), 500)
+
+    def test_get_chats_inbox_pagination(self):
+        chats = []
+        for i in range(5):
+            chat = Chat.objects.create(name=f"chat_{i}", create_by=self.user, is_group=False)
+            chat.participants.add(self.user)
+            store_message(chat.id, self.user, f"message {i}")
+            chats.append(chat)
+
+        url = reverse('chat')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        seen = []
+        next_url = f"{url}?page_size=2"
+        # The followed-channels set behind the ETag is cached per user; warm it so every page costs the same.
+        get_user_broadcasts(self.user.pk)
+        while next_url:
+            with self.assertNumQueries(2):
+                response = self.client.get(next_url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [chat['id'] for chat in response.data['results']]
+            next_url = response.data['next']
+        self.assertEqual(seen, [chat.id for chat in reversed(chats)])
+
+    def test_get_chats_tampered_cursor(self):
+        url = reverse('chat')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        for position in (["garbage", 1], ["2024-01-01 00:00:00+00:00", "x"], [None, 1]):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            response = self.client.get(url, {'cursor': cursor}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
 class MessageAPIViewTest(APITestCase):
     def setUp(self):
         self.user = Profile.objects.create_user(username='user', password='password')
@@ -147,6 +212,68 @@ class MessageAPIViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(Message.objects.count(), 1)
         self.assertEqual(Message.objects.first().message, "Hello!")
+        self.assertEqual(response.data['message']['body'], "Hello!")
+        self.assertEqual(response.data['message']['chat_id'], self.chat.id)
+
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.message_count, 1)
+        self.assertEqual(self.chat.last_message, Message.objects.first())
+        self.assertEqual(self.chat.last_message_at, Message.objects.first().timestamp)
+
+    @override_settings(CHAT_FANOUT_MODE='outbox')
+    def test_outbox_mode_leaves_delivery_to_the_relay(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        with patch('apps.chat.api.views.chat.send_to_groups', new_callable=AsyncMock) as send:
+            response = self.client.post(reverse('message'), {"chat": self.chat.id, "message": "Hello!"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        send.assert_not_called()
+        event = OutboxEvent.objects.get()
+        self.assertIn(f'user_{self.participant1.pk}', event.groups)
+        self.assertIn(response.data['message']['uid'], event.event['frame'])
+
+    @override_settings(CHAT_INGESTION_MODE='write_behind')
+    def test_write_behind_events_carry_uid_only(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        ingestor = MessageIngestor(batch_size=10, flush_interval=60, max_queue=10)
+        with patch('apps.chat.services.ingestion.get_ingestor', return_value=ingestor), \
+                patch('apps.chat.api.views.chat.send_to_groups', new_callable=AsyncMock) as send:
+            response = self.client.post(reverse('message'), {"chat": self.chat.id, "message": "Hello!"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('id', response.data['message'])
+        self.assertNotIn('seq', response.data['message'])
+
+        frame = json.loads(send.call_args.args[2]['frame'])
+        self.assertEqual(set(frame), {'v', 'type', 'uid', 'chat_id', 'sender_id', 'body', 'timestamp'})
+        self.assertEqual(frame['uid'], response.data['message']['uid'])
+
+        ingestor.flush()
+        self.assertEqual(str(Message.objects.get().uid), frame['uid'])
+
+    def test_rebuild_chat_stats(self):
+        first = Message.objects.create(chat=self.chat, sender=self.user, message="first")
+        last = Message.objects.create(chat=self.chat, sender=self.participant1, message="last")
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.message_count, 0)
+
+        call_command('rebuild_chat_stats', stdout=StringIO())
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.message_count, 2)
+        self.assertEqual(list(self.chat.messages.order_by('id').values_list('seq', flat=True)), [1, 2])
+        self.assertEqual(self.chat.last_message, last)
+        self.assertEqual(self.chat.last_message_at, last.timestamp)
+
+        self.assertEqual(self.chat.last_seq, 2)
+
+        last.delete()
+        call_command('rebuild_chat_stats', stdout=StringIO())
+        self.chat.refresh_from_db()
+        self.assertEqual((self.chat.message_count, self.chat.last_seq), (1, 2))
+        self.assertEqual(self.chat.last_message, first)
+
+        self.blocked_chat.refresh_from_db()
+        self.assertEqual(self.blocked_chat.message_count, 0)
+        self.assertIsNone(self.blocked_chat.last_message)
+        self.assertEqual(self.blocked_chat.last_message_at, self.blocked_chat.created)
 
     def test_send_message_blocked_user(self):
         url = reverse('blacklist')
@@ -164,6 +291,26 @@ class MessageAPIViewTest(APITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_send_message_group_query_count(self):
+        url = reverse('message')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+        query_counts = []
+        for size in (2, 20):
+            members = [Profile(username=f"member_{size}_{i}", password='password') for i in range(size)]
+            Profile.objects.bulk_create(members)
+            for member in members:
+                member.blacklist.add(self.user1)
+            group = Chat.objects.create(name=f"group_{size}", create_by=self.user, is_group=True)
+            group.participants.add(self.user, *members)
+
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(url, {"chat": group.id, "message": "Hello!"}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            query_counts.append(len(queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
     def test_send_message_to_chat_not_member(self):
         url = reverse('message')
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token1}")
@@ -175,7 +322,446 @@ class MessageAPIViewTest(APITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-class AddParticipantsToChatTest(APITestCase):
+class MessageHistoryAPIViewTest(APITestCase):
+    def setUp(self):
+        self.user = Profile.objects.create_user(username='user', password='password')
+        self.outsider = Profile.objects.create_user(username='user1', password='password')
+
+        self.chat = Chat.objects.create(name="test_chat", create_by=self.user, is_group=True)
+        self.chat.participants.add(self.user)
+        self.messages = [
+            Message.objects.create(chat=self.chat, sender=self.user, message=f"message {i}") for i in range(7)
+        ]
+
+        refresh = RefreshToken.for_user(self.user)
+        self.token = str(refresh.access_token)
+
+        refresh1 = RefreshToken.for_user(self.outsider)
+        self.token1 = str(refresh1.access_token)
+
+    def test_history_not_member(self):
+        url = reverse('message-history', kwargs={'chat_id': self.chat.id})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token1}")
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_history_older_pages(self):
+        url = reverse('message-history', kwargs={'chat_id': self.chat.id})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        pages = []
+        next_url = f"{url}?page_size=3"
+        while next_url:
+            response = self.client.get(next_url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append([message['id'] for message in response.data['results']])
+            next_url = response.data['older']
+        ids = [message.id for message in self.messages]
+        self.assertEqual(pages, [ids[4:], ids[1:4], ids[:1]])
+
+    def test_history_newer_than_cursor(self):
+        url = reverse('message-history', kwargs={'chat_id': self.chat.id})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        response = self.client.get(url, format='json')
+        newer_url = response.data['newer']
+
+        response = self.client.get(newer_url, format='json')
+        self.assertEqual(response.data['results'], [])
+
+        message = Message.objects.create(chat=self.chat, sender=self.user, message="new")
+        response = self.client.get(newer_url, format='json')
+        self.assertEqual([m['id'] for m in response.data['results']], [message.id])
+        self.assertIsNotNone(response.data['older'])
+
+        Message.objects.filter(pk__in=[m.pk for m in self.messages]).delete()
+        response = self.client.get(newer_url, format='json')
+        self.assertEqual([m['id'] for m in response.data['results']], [message.id])
+        self.assertIsNone(response.data['older'])
+
+    def test_history_tampered_cursor(self):
+        url = reverse('message-history', kwargs={'chat_id': self.chat.id})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        for position in (["garbage", 1], ["2024-01-01 00:00:00+00:00", "x"]):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+            for param in ('before', 'after'):
+                response = self.client.get(url, {param: cursor}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class MarkChatReadAPIViewTest(APITestCase):
+    def setUp(self):
+        self.user = Profile.objects.create_user(username='user', password='password')
+        self.participant = Profile.objects.create_user(username='user1', password='password')
+
+        self.chat = Chat.objects.create(name="test_chat", create_by=self.user, is_group=True)
+        self.chat.participants.add(self.user, self.participant)
+        self.messages = [store_message(self.chat.id, self.participant, f"message {i}") for i in range(5)]
+
+        refresh = RefreshToken.for_user(self.user)
+        self.token = str(refresh.access_token)
+
+    def unread_in_inbox(self):
+        response = self.client.get(reverse('chat'), format='json')
+        return response.data['results'][0]['unread_count']
+
+    def test_unread_count_in_inbox(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        self.assertEqual(self.unread_in_inbox(), 5)
+
+    def test_mark_read_up_to_message(self):
+        url = reverse('chat-read', kwargs={'chat_id': self.chat.id})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        response = self.client.post(url, {"message": self.messages[2].id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['last_read_id'], self.messages[2].id)
+        self.assertEqual(response.data['unread_count'], 2)
+        self.assertEqual(self.unread_in_inbox(), 2)
+
+        # The cursor never moves backwards.
+        response = self.client.post(url, {"message": self.messages[0].id}, format='json')
+        self.assertEqual(response.data['unread_count'], 2)
+
+    def test_mark_all_read_is_one_update(self):
+        url = reverse('chat-read', kwargs={'chat_id': self.chat.id})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, format='json')
+        self.assertEqual(response.data['unread_count'], 0)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(self.unread_in_inbox(), 0)
+
+    def test_mark_read_foreign_message(self):
+        other_chat = Chat.objects.create(name="other_chat", create_by=self.participant, is_group=True)
+        other_chat.participants.add(self.participant)
+        foreign = store_message(other_chat.id, self.participant, "foreign")
+
+        url = reverse('chat-read', kwargs={'chat_id': self.chat.id})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        response = self.client.post(url, {"message": foreign.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class MessageSearchAPIViewTest(APITestCase):
+    def setUp(self):
+        self.user = Profile.objects.create_user(username='user', password='password')
+        self.participant = Profile.objects.create_user(username='user1', password='password')
+
+        self.chat = Chat.objects.create(name="test_chat", create_by=self.user, is_group=True)
+        self.chat.participants.add(self.user, self.participant)
+        self.other_chat = Chat.objects.create(name="other_chat", create_by=self.participant, is_group=True)
+        self.other_chat.participants.add(self.participant)
+
+        self.strong = store_message(self.chat.id, self.participant, "deploy deploy deploy tonight")
+        self.weak = store_message(self.chat.id, self.participant, "we should deploy the new release after lunch today")
+        store_message(self.chat.id, self.participant, "nothing relevant here")
+        store_message(self.other_chat.id, self.participant, "deploy secret")
+
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+    def search(self, **params):
+        return self.client.get(reverse('message-search'), params)
+
+    def test_ranked_results_in_own_chats(self):
+        response = self.search(q='deploy')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([m['id'] for m in response.data['results']], [self.strong.id, self.weak.id])
+        self.assertIn('<mark>deploy</mark>', response.data['results'][0]['snippet'])
+
+    def test_snippet_is_escaped(self):
+        store_message(self.chat.id, self.participant, "<img src=x onerror=alert(1)> hello")
+        response = self.search(q='hello')
+        self.assertEqual(
+            response.data['results'][0]['snippet'], '&lt;img src=x onerror=alert(1)&gt; <mark>hello</mark>',
+        )
+
+    def test_query_syntax_is_escaped(self):
+        response = self.search(q='deploy" OR "secret')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+
+    def test_filter_by_chat(self):
+        response = self.search(q='deploy', chat=self.other_chat.id)
+        self.assertEqual(response.data['results'], [])
+
+    def test_pages(self):
+        response = self.search(q='deploy', page_size=1)
+        self.assertEqual([m['id'] for m in response.data['results']], [self.strong.id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([m['id'] for m in response.data['results']], [self.weak.id])
+        self.assertIsNone(response.data['next'])
+
+    def test_empty_query(self):
+        response = self.search(q=' ')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_index_follows_every_write(self):
+        direct = Message.objects.create(chat=self.chat, sender=self.user, message="hotfix tonight")
+        self.assertEqual([m['id'] for m in self.search(q='hotfix').data['results']], [direct.id])
+
+        Message.objects.filter(pk=direct.pk).update(message="rollback tonight")
+        self.assertEqual(self.search(q='hotfix').data['results'], [])
+        self.assertEqual([m['id'] for m in self.search(q='rollback').data['results']], [direct.id])
+
+        self.strong.delete()
+        self.assertEqual([m['id'] for m in self.search(q='deploy').data['results']], [self.weak.id])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM chat_message_fts")
+        self.assertEqual(self.search(q='deploy').data['results'], [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.search(q='deploy').data['results']), 2)
+
+class ChatListCachingTest(APITestCase):
+    def setUp(self):
+        self.user = Profile.objects.create_user(username='user', password='password')
+        self.participant = Profile.objects.create_user(username='user1', password='password')
+
+        self.chat = Chat.objects.create(name="test_chat", create_by=self.user, is_group=True)
+        self.chat.participants.add(self.user, self.participant)
+
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+    def test_not_modified_skips_view(self):
+        for name in ('chat', 'favorite', 'filter'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            etag = response['ETag']
+
+            # Only the authentication lookup of the user remains.
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse(name))
+            self.assertEqual(response['ETag'], etag)
+
+    def assertChanges(self, name, change):
+        etag = self.client.get(reverse(name))['ETag']
+        change()
+        response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_favorites_change(self):
+        response = self.assertChanges('favorite', lambda: self.user.favorits.add(self.chat))
+        self.assertEqual(response.data, [{'id': self.chat.id}])
+
+    def test_new_message_and_read(self):
+        response = self.assertChanges('chat', lambda: store_message(self.chat.id, self.participant, "Hello!"))
+        self.assertEqual(response.data['results'][0]['unread_count'], 1)
+        response = self.assertChanges('chat', lambda: self.client.post(reverse('chat-read', args=[self.chat.id])))
+        self.assertEqual(response.data['results'][0]['unread_count'], 0)
+
+    def test_membership_change(self):
+        other = Chat.objects.create(name="other", create_by=self.participant, is_group=True)
+        response = self.assertChanges('filter', lambda: other.participants.add(self.user))
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_own_messages_are_read(self):
+        for i in range(3):
+            store_message(self.chat.id, self.user, f"mine {i}")
+        store_messages([Message(chat_id=self.chat.id, sender=self.user, message="queued")])
+        response = self.client.get(reverse('chat'))
+        self.assertEqual(response.data['results'][0]['unread_count'], 0)
+
+        store_message(self.chat.id, self.participant, "theirs")
+        response = self.client.get(reverse('chat'))
+        self.assertEqual(response.data['results'][0]['unread_count'], 1)
+
+    def test_member_renamed(self):
+        store_message(self.chat.id, self.participant, "Hello!")
+
+        def rename():
+            self.participant.username = 'renamed'
+            self.participant.save(update_fields=['username'])
+
+        response = self.assertChanges('chat', rename)
+        self.assertEqual(response.data['results'][0]['last_message']['sender_username'], 'renamed')
+
+class SyncAPIViewTest(APITestCase):
+    def setUp(self):
+        self.user = Profile.objects.create_user(username='user', password='password')
+        self.participant = Profile.objects.create_user(username='user1', password='password')
+
+        self.chat = Chat.objects.create(name="test_chat", create_by=self.user, is_group=True)
+        self.chat.participants.add(self.user, self.participant)
+        self.other_chat = Chat.objects.create(name="other_chat", create_by=self.participant, is_group=True)
+        self.other_chat.participants.add(self.participant)
+        store_message(self.chat.id, self.participant, "before sync")
+
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+        self.token = self.client.get(reverse('sync')).data['token']
+
+    def sync(self, token, **params):
+        return self.client.get(reverse('sync'), {'token': token, **params})
+
+    def test_nothing_changed(self):
+        response = self.sync(self.token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['messages'], [])
+        self.assertEqual(response.data['events'], [])
+        # Only the base time moves forward.
+        self.assertEqual(decode_token(response.data['token'])[1:], decode_token(self.token)[1:])
+
+    def test_returns_only_changes(self):
+        new = store_message(self.chat.id, self.participant, "after sync")
+        store_message(self.other_chat.id, self.participant, "not for user")
+        response = self.sync(self.token)
+        self.assertEqual([m['id'] for m in response.data['messages']], [new.id])
+
+        self.user.favorits.add(self.chat)
+        self.other_chat.participants.add(self.user)
+
+        response = self.sync(self.token)
+        self.assertEqual(
+            [(e['kind'], e['chat_id']) for e in response.data['events']],
+            [('favorited', self.chat.id), ('joined', self.other_chat.id)],
+        )
+        self.assertFalse(response.data['has_more'])
+
+        response = self.sync(response.data['token'])
+        self.assertEqual(response.data['messages'], [])
+        self.assertEqual(response.data['events'], [])
+
+    def test_left_chat(self):
+        self.chat.participants.remove(self.user)
+        response = self.sync(self.token)
+        self.assertEqual([(e['kind'], e['chat_id']) for e in response.data['events']], [('left', self.chat.id)])
+
+    def test_pages(self):
+        sent = [store_message(self.chat.id, self.participant, f"message {i}").id for i in range(5)]
+        token, received = self.token, []
+        while True:
+            response = self.sync(token, limit=2)
+            received += [m['id'] for m in response.data['messages']]
+            token = response.data['token']
+            if not response.data['has_more']:
+                break
+        self.assertEqual(received, sent)
+
+    def test_late_commit_is_not_skipped(self):
+        # A writer that got its id first but commits after a newer message.
+        reserved = store_message(self.chat.id, self.participant, "placeholder")
+        reserved_id, reserved_seq = reserved.id, reserved.seq
+        reserved.delete()
+        token = self.client.get(reverse('sync')).data['token']
+
+        other = Chat.objects.create(name="third", create_by=self.user, is_group=True)
+        other.participants.add(self.user)
+        newer = store_message(other.id, self.participant, "newer")
+        response = self.sync(token)
+        self.assertEqual([m['id'] for m in response.data['messages']], [newer.id])
+
+        late = Message.objects.create(id=reserved_id, chat=self.chat, sender=self.participant, message="late", seq=reserved_seq + 1)
+        Chat.objects.filter(pk=self.chat.pk).update(last_seq=late.seq)
+        response = self.sync(response.data['token'])
+        self.assertEqual([m['id'] for m in response.data['messages']], [late.id])
+
+    def test_joined_chat_starts_at_join(self):
+        other = Chat.objects.create(name="history", create_by=self.participant, is_group=True)
+        other.participants.add(self.participant)
+        for i in range(30):
+            store_message(other.id, self.participant, f"old {i}")
+        other.participants.add(self.user)
+        new = store_message(other.id, self.participant, "new")
+
+        response = self.sync(self.token)
+        self.assertEqual([m['id'] for m in response.data['messages']], [new.id])
+        self.assertEqual([e['kind'] for e in response.data['events']], ['joined'])
+
+    def test_token_only_names_recent_chats(self):
+        chats = [Chat(name=f"quiet {i}", create_by=self.user, is_group=True) for i in range(200)]
+        Chat.objects.bulk_create(chats)
+        self.user.chats.add(*chats)
+        for chat in chats:
+            store_message(chat.id, self.participant, "old")
+        Chat.objects.filter(pk__in=[chat.pk for chat in chats]).update(last_message_at=timezone.now() - timedelta(days=1))
+
+        token = self.client.get(reverse('sync')).data['token']
+        self.assertLess(len(token), 200)
+        with self.assertNumQueries(4):
+            response = self.sync(token)
+        self.assertEqual(response.data['messages'], [])
+        self.assertLess(len(response.data['token']), 200)
+
+    def test_invalid_token(self):
+        response = self.sync('not-a-token')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        tampered = base64.urlsafe_b64encode(json.dumps({'c': [1], 'e': 0}).encode()).decode()
+        self.assertEqual(self.sync(tampered).status_code, status.HTTP_400_BAD_REQUEST)
+
+class BroadcastChatTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = Profile.objects.create_user(username='admin', password='password')
+        self.subscriber = Profile.objects.create_user(username='subscriber', password='password')
+        self.admin_token = str(RefreshToken.for_user(self.admin).access_token)
+        self.subscriber_token = str(RefreshToken.for_user(self.subscriber).access_token)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.admin_token}")
+        response = self.client.post(reverse('chat'), {"name": "news", "is_broadcast": True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.chat = Chat.objects.get(name="news")
+
+    def post_message(self, token, body):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        return self.client.post(reverse('message'), {"chat": self.chat.id, "message": body}, format='json')
+
+    def test_created_with_admin(self):
+        self.assertTrue(self.chat.is_broadcast)
+        self.assertTrue(self.chat.is_group)
+        self.assertEqual(list(self.chat.admins.all()), [self.admin])
+
+    def test_subscribe_and_unsubscribe(self):
+        url = reverse('chat-subscribe', args=[self.chat.id])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.subscriber_token}")
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.post(url).status_code, status.HTTP_200_OK)
+        self.assertTrue(self.chat.participants.filter(id=self.subscriber.id).exists())
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(self.chat.participants.filter(id=self.subscriber.id).exists())
+
+    def test_only_admins_post(self):
+        self.chat.participants.add(self.subscriber)
+        self.assertEqual(self.post_message(self.subscriber_token, "hi").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.post_message(self.admin_token, "hi").status_code, status.HTTP_201_CREATED)
+
+    def test_only_admins_add_participants(self):
+        self.chat.participants.add(self.subscriber)
+        other = Profile.objects.create_user(username='other', password='password')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.subscriber_token}")
+        data = {"id": self.chat.id, "participants": [str(other.id)]}
+        response = self.client.post(reverse('add_participants'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_history_is_served_from_the_cached_timeline(self):
+        self.chat.participants.add(self.subscriber)
+        sent = [self.post_message(self.admin_token, f"news {i}").data['message']['id'] for i in range(3)]
+        url = reverse('message-history', args=[self.chat.id])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.subscriber_token}")
+
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual([message['id'] for message in response.data['results']], sent[1:])
+        # user lookup and membership; the window itself comes from the cache.
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'page_size': 2})
+        self.assertEqual([message['id'] for message in response.data['results']], sent[1:])
+
+        response = self.client.get(response.data['older'])
+        self.assertEqual([message['id'] for message in response.data['results']], sent[:1])
+
+    def test_read_cursor_is_not_broadcast(self):
+        self.chat.participants.add(self.subscriber)
+        self.post_message(self.admin_token, "news")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.subscriber_token}")
+        with patch('apps.chat.api.views.chat.send_to_groups', new_callable=AsyncMock) as send:
+            response = self.client.post(reverse('chat-read', args=[self.chat.id]), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(send.call_args.args[1], [f'user_{self.subscriber.pk}'])
+
+class AddParticipantsToChatTest(QueryCountMixin, APITestCase):
     def setUp(self):
         self.user = Profile.objects.create_user(username='user', password='password')
         self.user1 = Profile.objects.create_user(username='user_1', password='password')
@@ -247,6 +833,38 @@ class AddParticipantsToChatTest(APITestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_add_participants_report(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        missing = '00000000-0000-0000-0000-000000000000'
+        data = {
+            "id": self.chat.id,
+            "participants": [str(self.participant3.id), str(self.participant1.id), missing, str(self.participant3.id)]
+        }
+        response = self.client.post(reverse('add_participants'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['added'], 1)
+        self.assertEqual(
+            [(str(result['id']), result['status']) for result in response.data['results']],
+            [(str(self.participant3.id), 'added'), (str(self.participant1.id), 'already_member'), (missing, 'not_found')],
+        )
+        self.assertTrue(ReadState.objects.filter(chat=self.chat, user=self.participant3).exists())
+
+    def test_add_participants_constant_queries(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        url = reverse('add_participants')
+        chat = Chat.objects.create(name="bulk", create_by=self.user, is_group=True)
+        chat.participants.add(self.user)
+
+        def add(count):
+            users = [Profile(username=f'bulk{count}_{i}') for i in range(count)]
+            Profile.objects.bulk_create(users)
+            data = {"id": chat.id, "participants": [str(user.id) for user in users]}
+            cache.clear()
+            return self.count_queries(lambda: self.client.post(url, data, format='json'))
+
+        self.assertEqual(add(1), add(50))
+        self.assertEqual(chat.participants.count(), 52)
+
     class FavoriteChatListAPIViewTest(APITestCase):
         def setUp(self):
             self.user = Profile.objects.create_user(username='user', password='password')
@@ -305,7 +923,7 @@ class AddParticipantsToChatTest(APITestCase):
             response = self.client.get(url, format='json')
             self.assertEqual(response.status_code, status.HTTP_200_OK)
 
-class ListChatFilterAPIViewTest(APITestCase):
+class ListChatFilterAPIViewTest(QueryCountMixin, APITestCase):
     def setUp(self):
         self.user = Profile.objects.create_user(username='user', password='password')
         self.user1 = Profile.objects.create_user(username='user1', password='password')
@@ -324,11 +942,59 @@ class ListChatFilterAPIViewTest(APITestCase):
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
         response = self.client.get(url, {'is_group': 'true'}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data[0]['name'], self.chat_group.name)
+        self.assertEqual(response.data['results'][0]['name'], self.chat_group.name)
 
     def test_list_chat_private_filter(self):
         url = reverse('filter')
         self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
         response = self.client.get(url, {'is_group': 'false'}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data[0]['name'], self.chat_private.name)
\ No newline at end of file
+        self.assertEqual(response.data['results'][0]['name'], self.chat_private.name)
+
+    def test_summary_does_not_load_messages(self):
+        store_message(self.chat_group.id, self.user, "hello")
+        url = reverse('filter')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, format='json')
+        self.assertNotIn('messages', response.data['results'][0])
+        self.assertFalse([q for q in queries if 'chat_message' in q['sql']])
+
+    def test_requested_fields(self):
+        store_message(self.chat_group.id, self.user, "hello")
+        url = reverse('filter')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        response = self.client.get(url, {'fields': 'id,messages', 'is_group': 'true'}, format='json')
+        self.assertEqual(set(response.data['results'][0]), {'id', 'messages'})
+        self.assertEqual(response.data['results'][0]['messages'][0]['message'], "hello")
+
+    def test_only_own_chats(self):
+        other = Chat.objects.create(name="other", create_by=self.user1, is_group=True)
+        other.participants.add(self.user1, self.user2)
+        url = reverse('filter')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        response = self.client.get(url, format='json')
+        self.assertNotIn(other.id, [chat['id'] for chat in response.data['results']])
+    def test_latest_messages_only(self):
+        sent = [store_message(self.chat_group.id, self.user, f"message {i}").id for i in range(5)]
+        url = reverse('filter')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        with patch.object(ListChatFilterAPIView, 'messages_limit', 3):
+            response = self.client.get(url, {'fields': 'id,messages', 'is_group': 'true'}, format='json')
+        self.assertEqual([m['id'] for m in response.data['results'][0]['messages']], sent[-3:])
+
+    def test_queries_do_not_grow_with_chats(self):
+        url = reverse('filter')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+        def grow():
+            for _ in range(5):
+                chat = Chat.objects.create(name="more", create_by=self.user, is_group=True)
+                chat.participants.add(self.user, self.user1)
+                store_message(chat.id, self.user1, "hello")
+
+        queries = self.assertConstantQueries(
+            lambda: self.client.get(url, {'fields': 'id,participants,messages', 'page_size': 100}), grow,
+        )
+        # user lookup, followed channels (re-read after each membership change), chats, participants, messages
+        self.assertEqual(queries, 5)
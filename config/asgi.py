@@ -2,17 +2,20 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+# Initialize Django before importing anything that touches models.
+django_asgi_app = get_asgi_application()
+
 from apps.chat.api.routing import websocket_urlpatterns
+from apps.account.api.middleware import JWTAuthMiddlewareStack
 
-from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
-
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket":AuthMiddlewareStack(
+    "http": django_asgi_app,
+    "websocket":JWTAuthMiddlewareStack(
         URLRouter(websocket_urlpatterns)
     ),
 })
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 
@@ -166,6 +168,19 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Chat versions (ETags), ACL and blacklist sets and the broadcast flags are
+# invalidated by whichever worker handles the write, so every process must
+# share one cache; a per-process LocMemCache would keep serving stale entries.
+# Tests run in one process and clear the cache freely, so they get their own.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ.get("CACHE_REDIS_URL", "redis://127.0.0.1:6379/1"),
+    },
+}
+if sys.argv[1:2] == ["test"]:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
 
 REST_FRAMEWORK = {
 
@@ -184,6 +199,14 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME" : timedelta(days=3)
 }
 
+# WebSocket JWT auth: resolved profiles are cached in-process until the token
+# expires, capped so deactivated users drop out within WS_AUTH_CACHE_MAX_TTL seconds.
+WS_AUTH_CACHE_SIZE = 10000
+WS_AUTH_CACHE_MAX_TTL = 300
+
+# Per-user blocked / blocked-by id sets (apps.account.services.blacklist), dropped on every blacklist change.
+BLACKLIST_CACHE_TIMEOUT = 300
+
 PASSWORD_HASHERS = [
     "django.contrib.auth.hashers.Argon2PasswordHasher",
     "django.contrib.auth.hashers.PBKDF2PasswordHasher",
@@ -191,3 +214,72 @@ PASSWORD_HASHERS = [
     "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
     "django.contrib.auth.hashers.ScryptPasswordHasher",
 ]
+
+# Chat
+# Seconds a per-chat membership/blacklist snapshot may be served from the cache.
+CHAT_ACL_CACHE_TIMEOUT = 60
+
+# Inbox, chat-list and favorites responses are cached per user under an ETag
+# derived from a version that every relevant write bumps; this TTL only bounds
+# how long stale entries linger in the cache.
+CHAT_RESPONSE_CACHE_TIMEOUT = 300
+
+# Message ingestion: "sync" writes each message on the request, "write_behind"
+# queues it in-process and bulk-inserts every CHAT_INGESTION_FLUSH_INTERVAL_MS
+# or every CHAT_INGESTION_BATCH_SIZE messages, whichever comes first. Queued
+# messages are acked and fanned out before they have an id or seq, so their
+# responses and events identify them by uid only.
+CHAT_INGESTION_MODE = "sync"
+CHAT_INGESTION_BATCH_SIZE = 200
+CHAT_INGESTION_FLUSH_INTERVAL_MS = 50
+CHAT_INGESTION_QUEUE_SIZE = 10000
+
+# WebSocket clients connecting with ?batch=1 get events coalesced into JSON
+# array frames of up to CHAT_WS_BATCH_MAX_SIZE, flushed CHAT_WS_BATCH_WINDOW_MS
+# after the first buffered event.
+CHAT_WS_BATCH_WINDOW_MS = 20
+CHAT_WS_BATCH_MAX_SIZE = 50
+
+# Frames waiting to be written to one WebSocket. When a slow client lets
+# CHAT_WS_OUTBOUND_QUEUE_SIZE pile up: "drop_oldest" discards the oldest,
+# "resync" swaps the backlog for one resync marker, "disconnect" closes with 4008.
+CHAT_WS_OUTBOUND_QUEUE_SIZE = 500
+CHAT_WS_OVERFLOW_POLICY = "resync"
+
+# Sync tokens name a base time, CHAT_SYNC_COMMIT_LAG seconds before they were
+# issued, plus exact per-chat positions only for chats active since then. It
+# must exceed the longest delay between a message's timestamp and its commit,
+# write-behind queueing included.
+CHAT_SYNC_COMMIT_LAG = 300
+
+# Presence and typing. Connections count as online for CHAT_PRESENCE_TTL seconds
+# after their last heartbeat, which open sockets send every third of the TTL;
+# the store is Redis when CHAT_PRESENCE_REDIS_URL is
+# set and in-process otherwise. Each user's typing frames pass once per
+# CHAT_TYPING_THROTTLE_MS and are merged per chat over CHAT_TYPING_COALESCE_MS.
+CHAT_PRESENCE_REDIS_URL = None
+CHAT_PRESENCE_TTL = 60
+CHAT_TYPING_THROTTLE_MS = 2000
+CHAT_TYPING_COALESCE_MS = 300
+
+# Channel-layer fan-out. A chat's sockets are spread over CHAT_GROUP_SHARDS
+# groups by a hash of the channel name (CHAT_BROADCAST_SHARDS for broadcast
+# channels), and every event is sent to all shards concurrently. Each shard
+# costs one group_send per event, so regular chats, mostly small, use one.
+CHAT_GROUP_SHARDS = 1
+
+# Broadcast channels: the newest CHAT_BROADCAST_TIMELINE_SIZE messages are
+# cached once for every subscriber to share.
+CHAT_BROADCAST_SHARDS = 16
+CHAT_BROADCAST_TIMELINE_SIZE = 50
+CHAT_BROADCAST_TIMELINE_TIMEOUT = 3600
+
+# Fan-out: "inline" sends events to the channel layer during the request;
+# "outbox" stores them in the same transaction as the change and leaves
+# delivery to `manage.py relay_outbox`, which sends CHAT_OUTBOX_BATCH_SIZE rows
+# at a time and polls every CHAT_OUTBOX_POLL_INTERVAL_MS when idle. Sockets
+# remember the last CHAT_OUTBOX_DEDUPE_WINDOW relayed ids to drop redeliveries.
+CHAT_FANOUT_MODE = "inline"
+CHAT_OUTBOX_BATCH_SIZE = 500
+CHAT_OUTBOX_POLL_INTERVAL_MS = 50
+CHAT_OUTBOX_DEDUPE_WINDOW = 1000